@@ -0,0 +1,64 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  Throughput of `sort_catalog` in one process and across process pools of
+  growing size.
+
+  Run with ``PYTHONPATH=src python benchmarks/bench_catalog.py [rows]``.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import sys
+import time
+
+from livetribe.utils.version import sort_catalog
+
+
+def make_rows(count):
+    rng = random.Random(count)
+    return [('artifact-%d' % rng.randrange(1000),
+             '%d.%d.%d%s' % (rng.randrange(20), rng.randrange(50), rng.randrange(200), rng.choice(('', '', '-RC1', '-SNAPSHOT'))))
+            for _ in range(count)]
+
+
+def drain(rows, executor=None, chunksize=100000):
+    result = sort_catalog(rows, executor=executor, chunksize=chunksize)
+    for _ in result.rows:
+        pass
+
+
+def timed(label, count, func, *args):
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+    sys.stdout.write('%-28s %8.3fs %12.0f rows/s\n' % (label, elapsed, count / elapsed))
+
+
+def main(count=1000000):
+    rows = make_rows(count)
+
+    timed('sort_catalog', count, drain, rows)
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ProcessPoolExecutor(workers) as executor:
+            timed('sort_catalog (%d processes)' % workers, count, drain, rows, executor, max(count // (workers * 4), 1))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,71 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  Throughput of `StandardVersion.parse_many` against a scalar parse loop.
+
+  Run with ``PYTHONPATH=src python benchmarks/bench_parse.py [rows]``.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import random
+import sys
+import time
+
+from livetribe.utils.version import StandardVersion
+
+
+def make_rows(count, invalid_ratio=0.01):
+    rng = random.Random(count)
+    rows = []
+    for _ in range(count):
+        if rng.random() < invalid_ratio:
+            rows.append('not-a-version')
+        else:
+            rows.append('%d.%d.%d%s' % (rng.randrange(20), rng.randrange(50), rng.randrange(200),
+                                        rng.choice(('', '', '-RC1', '-SNAPSHOT'))))
+    return rows
+
+
+def scalar_loop(rows):
+    versions = []
+    invalid = []
+    for index, row in enumerate(rows):
+        try:
+            versions.append(StandardVersion.parse(row))
+        except ValueError:
+            versions.append(None)
+            invalid.append(index)
+    return versions, invalid
+
+
+def timed(label, count, func, *args):
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+    sys.stdout.write('%-28s %8.3fs %12.0f rows/s\n' % (label, elapsed, count / elapsed))
+
+
+def main(count=1000000):
+    rows = make_rows(count)
+
+    timed('scalar parse loop', count, scalar_loop, rows)
+    timed('parse_many', count, StandardVersion.parse_many, rows)
+    with ProcessPoolExecutor() as executor:
+        timed('parse_many (process pool)', count, StandardVersion.parse_many, rows, executor, 50000)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
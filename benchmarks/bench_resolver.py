@@ -0,0 +1,68 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  Resolution time of `Resolver` on synthetic layered dependency graphs.
+
+  Run with ``PYTHONPATH=src python benchmarks/bench_resolver.py [packages] [versions]``.
+"""
+import random
+import sys
+import time
+
+from livetribe.utils.resolver import ResolutionError, Resolver
+
+
+def make_graph(packages, versions, fanout=3, seed=1):
+    """
+      Build a layered graph where every version of a package depends on a few
+      later packages.  Newer versions ask for narrower, newer ranges, so the
+      highest versions often conflict and the search has to back up.
+    """
+
+    rng = random.Random(seed)
+    names = ['pkg%04d' % i for i in range(packages)]
+    candidates = dict((name, ['%d.0' % v for v in range(1, versions + 1)]) for name in names)
+    dependencies = {}
+    for i, name in enumerate(names):
+        later = names[i + 1:]
+        for v in range(1, versions + 1):
+            requirements = {}
+            for dependency in rng.sample(later, min(fanout, len(later))):
+                low = max(1, v - rng.randrange(0, versions))
+                high = min(versions, low + rng.randrange(2, versions))
+                requirements[dependency] = '[%d.0,%d.0]' % (low, high)
+            dependencies[(name, '%d.0' % v)] = requirements
+    return names, candidates, dependencies
+
+
+def main(packages=300, versions=10):
+    names, candidates, dependencies = make_graph(packages, versions)
+    resolver = Resolver(candidates, dependencies)
+    requirements = dict((name, '1.0') for name in names[:10])
+
+    for label in ('cold', 'warm'):
+        start = time.time()
+        try:
+            solution = resolver.resolve(requirements)
+            outcome = '%d packages resolved' % len(solution)
+        except ResolutionError as error:
+            outcome = '%d conflicting requirements' % len(error.conflicts)
+        sys.stdout.write('%-5s %8.3fs  %s\n' % (label, time.time() - start, outcome))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,254 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  Benchmark suite comparing timings against a stored baseline.
+
+  Every workload is timed several times and its best time is compared with
+  the baseline file; a workload slower than the baseline by more than the
+  threshold is reported as a regression and makes the run fail.  Timings
+  only compare meaningfully on the machine that recorded the baseline.
+
+  Run with ``python setup.py bench`` or, from the project root,
+  ``PYTHONPATH=src python benchmarks/suite.py [--save] [--baseline FILE]
+  [--threshold PERCENT] [--scale FACTOR] [--repeat N] [workload ...]``.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from livetribe.utils.file import temp_directory, TempDirectoryPool
+from livetribe.utils.resolver import ResolutionError, Resolver
+from livetribe.utils.version import compile_range, StandardVersion, VersionRange, VersionSet
+
+import bench_catalog
+import bench_parse
+import bench_resolver
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+WORKLOADS = []
+
+
+def workload(name):
+    """
+      Register a workload.  The decorated function receives the scale factor,
+      performs any setup and returns the callable to time.
+    """
+
+    def register(func):
+        WORKLOADS.append((name, func))
+        return func
+
+    return register
+
+
+def make_versions(count):
+    return [StandardVersion.parse(row) for row in bench_parse.make_rows(count, invalid_ratio=0)]
+
+
+@workload('parse')
+def bench_parse_loop(scale):
+    rows = bench_parse.make_rows(int(200000 * scale), invalid_ratio=0)
+    parse = StandardVersion.parse
+    return lambda: [parse(row) for row in rows]
+
+
+@workload('parse_many')
+def bench_parse_many(scale):
+    rows = bench_parse.make_rows(int(200000 * scale))
+    return lambda: StandardVersion.parse_many(rows)
+
+
+@workload('sort')
+def bench_sort(scale):
+    versions = make_versions(int(1000000 * scale))
+    return lambda: sorted(versions)
+
+
+@workload('cmp')
+def bench_cmp(scale):
+    versions = make_versions(int(200000 * scale))
+    pairs = list(zip(versions, versions[1:]))
+    return lambda: [a.__cmp__(b) for a, b in pairs]
+
+
+@workload('hash')
+def bench_hash(scale):
+    versions = make_versions(int(1000000 * scale))
+    return lambda: len(set(versions))
+
+
+@workload('range_contains')
+def bench_range_contains(scale):
+    versions = make_versions(int(1000000 * scale))
+    version_range = VersionRange.parse('[1.5,10.25-RC1)')
+    return lambda: [v for v in versions if version_range.contains(v)]
+
+
+@workload('range_filter')
+def bench_range_filter(scale):
+    versions = make_versions(int(1000000 * scale))
+    matcher = compile_range('[1.5,3.0),[5.0,7.0],(12.0,)')
+    return lambda: matcher.filter(versions)
+
+
+@workload('set_membership')
+def bench_set_membership(scale):
+    versions = make_versions(int(1000000 * scale))
+    version_set = VersionSet.parse('[1.0,2.0),[4.0,6.0)') | VersionSet.parse('[8.0,9.0]') - VersionSet.parse('[5.0,5.5)')
+    return lambda: [v for v in versions if version_set.contains(v)]
+
+
+def churn(count, factory):
+    for _ in range(count):
+        with factory() as path:
+            for name in ('a', 'b', 'c'):
+                with open(os.path.join(path, name), 'w') as fp:
+                    fp.write(name)
+
+
+@workload('temp_directory')
+def bench_temp_directory(scale):
+    return lambda: churn(int(2000 * scale), temp_directory)
+
+
+@workload('temp_directory_pool')
+def bench_temp_directory_pool(scale):
+    pool = TempDirectoryPool()
+    return lambda: churn(int(2000 * scale), pool.temp_directory)
+
+
+@workload('sort_catalog')
+def bench_sort_catalog(scale):
+    rows = bench_catalog.make_rows(int(200000 * scale))
+    return lambda: bench_catalog.drain(rows)
+
+
+@workload('resolve')
+def bench_resolve(scale):
+    names, candidates, dependencies = bench_resolver.make_graph(max(int(300 * scale), 20), 10)
+    requirements = dict((name, '1.0') for name in names[:10])
+
+    def resolve():
+        try:
+            Resolver(candidates, dependencies).resolve(requirements)
+        except ResolutionError:
+            pass
+
+    return resolve
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def environment():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(), 'machine': platform.machine(), 'node': platform.node()}
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (IOError, OSError):
+        return None
+
+
+def run(names=None, baseline=DEFAULT_BASELINE, threshold=10.0, scale=1.0, repeat=3, save=False, out=sys.stdout):
+    """
+      Run the named workloads, or all of them, and compare them with the
+      baseline.
+
+      :returns: The names of the workloads that regressed.
+    """
+
+    unknown = set(names or ()) - set(name for name, _ in WORKLOADS)
+    if unknown:
+        raise ValueError('Unknown workloads: %s' % ', '.join(sorted(unknown)))
+
+    recorded = load_baseline(baseline)
+    previous = {}
+    if recorded is not None:
+        if recorded.get('scale') != scale:
+            out.write('Baseline %s was recorded at scale %s, not comparing\n' % (baseline, recorded.get('scale')))
+        else:
+            previous = recorded.get('results', {})
+            if recorded.get('environment') != environment():
+                out.write('Warning: baseline %s was recorded in a different environment\n' % baseline)
+
+    results = {}
+    regressions = []
+    out.write('%-20s %10s %10s %9s\n' % ('workload', 'seconds', 'baseline', 'change'))
+    for name, setup in WORKLOADS:
+        if names and name not in names:
+            continue
+
+        results[name] = elapsed = measure(setup(scale), repeat)
+        if name in previous:
+            change = (elapsed - previous[name]) / previous[name] * 100.0
+            flag = '  REGRESSION' if change > threshold else ''
+            if flag:
+                regressions.append(name)
+            out.write('%-20s %10.4f %10.4f %+8.1f%%%s\n' % (name, elapsed, previous[name], change, flag))
+        else:
+            out.write('%-20s %10.4f %10s %9s\n' % (name, elapsed, '-', '-'))
+        out.flush()
+
+    if save:
+        if recorded is not None and recorded.get('scale') == scale:
+            previous.update(results)
+            results = previous
+        with open(baseline, 'w') as fp:
+            json.dump({'scale': scale, 'environment': environment(), 'results': results}, fp, indent=2, sort_keys=True)
+        out.write('Baseline written to %s\n' % baseline)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the livetribe-utils benchmarks.')
+    parser.add_argument('workloads', nargs='*', help='workloads to run, default all: %s' % ', '.join(name for name, _ in WORKLOADS))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare with and save to')
+    parser.add_argument('--threshold', type=float, default=10.0, help='slowdown in percent reported as a regression')
+    parser.add_argument('--scale', type=float, default=1.0, help='factor applied to every workload size')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timings, the best is kept')
+    parser.add_argument('--save', action='store_true', help='record the results as the new baseline')
+    args = parser.parse_args(argv)
+    unknown = set(args.workloads) - set(name for name, _ in WORKLOADS)
+    if unknown:
+        parser.error('unknown workloads: %s' % ', '.join(sorted(unknown)))
+
+    regressions = run(args.workloads, args.baseline, args.threshold, args.scale, args.repeat, args.save)
+    if regressions:
+        sys.stdout.write('Regressions beyond %s%%: %s\n' % (args.threshold, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -59,9 +59,50 @@ class doc(Command):
                          '   %s/\n' % (mode, path))
 
 
+class bench(Command):
+    description = 'run benchmarks and compare them with the stored baseline'
+    user_options = [('save', 's', 'record the results as the new baseline'),
+                    ('baseline=', 'b', 'baseline file to compare with and save to'),
+                    ('threshold=', 't', 'slowdown in percent reported as a regression'),
+                    ('scale=', None, 'factor applied to every workload size'),
+                    ('workloads=', 'w', 'comma separated workloads to run, default all')]
+    boolean_options = ['save']
+
+    def initialize_options(self):
+        self.save = False
+        self.baseline = None
+        self.threshold = None
+        self.scale = None
+        self.workloads = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        args = [sys.executable, 'benchmarks/suite.py']
+        if self.save:
+            args.append('--save')
+        if self.baseline:
+            args.extend(['--baseline', self.baseline])
+        if self.threshold:
+            args.extend(['--threshold', self.threshold])
+        if self.scale:
+            args.extend(['--scale', self.scale])
+        if self.workloads:
+            args.extend(self.workloads.split(','))
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, ['src', env.get('PYTHONPATH')]))
+
+        status = subprocess.call(args, env=env)
+
+        if status:
+            raise RuntimeError('benchmark step failed')
+
+
 class test(Command):
-    description = 'run nosetests'
-    user_options = [('verbose', 'v', 'run nosetests with -v option')]
+    description = 'run pytest'
+    user_options = [('verbose', 'v', 'run pytest with -v option')]
     boolean_options = ['verbose']
 
     def initialize_options(self):
@@ -71,22 +112,24 @@ class test(Command):
         pass
 
     def run(self):
+        args = [sys.executable, '-m', 'pytest']
         if self.verbose:
-            verbose = '-v'
-        else:
-            verbose = ''
+            args.append('-v')
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, ['src', env.get('PYTHONPATH')]))
 
-        status = subprocess.call(['nosetests', verbose])
+        status = subprocess.call(args, env=env)
 
         if status:
-            raise RuntimeError('nosetests step failed')
+            raise RuntimeError('pytest step failed')
 
 
 with open('requirements.txt') as f:
     install_requires = f.read().splitlines()
 
 tests_requires = install_requires + [
-    'nose >= 1.2',
+    'pytest >= 4.6',
 ]
 
 setup(
@@ -100,16 +143,15 @@ setup(
     # don't ever depend on refcounting to close files anywhere else
     long_description=open('README.rst', encoding='utf-8').read(),
 
-    namespace_packages=['livetribe'],
     package_dir={'': 'src'},
     packages=find_packages('src'),
 
     zip_safe=False,
     platforms='any',
+    python_requires='>=3.7',
     install_requires=install_requires,
 
     tests_require=tests_requires,
-    test_suite='nose.collector',
 
     classifiers=[
         'Intended Audience :: Developers',
@@ -117,11 +159,15 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
-    cmdclass={'doc': doc, 'test': test},
+    cmdclass={'bench': bench, 'doc': doc, 'test': test},
 )
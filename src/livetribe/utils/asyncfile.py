@@ -0,0 +1,107 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  asyncio variants of the file utilities, kept apart from
+  `livetribe.utils.file` so that importing it does not import asyncio.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import shutil
+import tempfile
+import threading
+import time
+
+
+class AsyncTempDirectories(object):
+    """
+    Creates and removes temporary directories on executor threads so that
+    the event loop never waits on the filesystem.
+
+    Directories are created on a pool of `max_workers` threads and removed
+    on a separate pool of `max_cleanups` threads, which caps how many
+    removals run at once and keeps large removals from delaying creation.
+
+    :param max_workers: The number of threads creating directories.
+    :param max_cleanups: The number of removals that may run at once.
+    :param cleanup: The callable that removes a directory.
+    :param on_cleanup: An optional callable receiving the path and the
+      seconds spent removing it, called on the event loop.
+    """
+
+    def __init__(self, max_workers=4, max_cleanups=2, cleanup=shutil.rmtree, on_cleanup=None):
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._cleanup_executor = ThreadPoolExecutor(max_cleanups)
+        self._cleanup = cleanup
+        self._on_cleanup = on_cleanup
+
+    def temp_directory(self, *args, **kwargs):
+        """
+        Async context manager returns a path created by mkdtemp and removes
+        it afterwards.  The arguments are passed on to mkdtemp.
+        """
+
+        return _AsyncTempDirectory(self, args, kwargs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+        self._cleanup_executor.shutdown(wait)
+
+
+class _AsyncTempDirectory(object):
+    def __init__(self, owner, args, kwargs):
+        self._owner = owner
+        self._args = args
+        self._kwargs = kwargs
+        self.path = None
+        self.cleanup_seconds = None
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self.path = await loop.run_in_executor(self._owner._executor, functools.partial(tempfile.mkdtemp, *self._args, **self._kwargs))
+        return self.path
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        owner = self._owner
+        loop = asyncio.get_running_loop()
+        self.cleanup_seconds = await loop.run_in_executor(owner._cleanup_executor, _timed, owner._cleanup, self.path)
+        if owner._on_cleanup is not None:
+            owner._on_cleanup(self.path, self.cleanup_seconds)
+
+
+def _timed(func, path):
+    start = time.perf_counter()
+    func(path)
+    return time.perf_counter() - start
+
+
+_default = []
+_default_lock = threading.Lock()
+
+
+def async_temp_directory(*args, **kwargs):
+    """
+    Async context manager returns a path created by mkdtemp and removes it
+    afterwards, both on the threads of a shared `AsyncTempDirectories`.
+    """
+
+    if not _default:
+        with _default_lock:
+            if not _default:
+                _default.append(AsyncTempDirectories())
+    return _default[0].temp_directory(*args, **kwargs)
@@ -0,0 +1,158 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+""" Small, thread-safe caching helpers. """
+
+import collections
+import threading
+import weakref
+
+
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+
+class LRUCache(object):
+    """
+      A bounded, thread-safe least-recently-used cache.
+
+      Once the cache holds `maxsize` entries, storing a new key evicts the
+      entry that was used least recently.
+    """
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("Invalid cache size '%s'" % maxsize)
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            data = self._data
+            if key in data:
+                data.move_to_end(key)
+            elif len(data) >= self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+            data[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ShardedLRUCache(object):
+    """
+      A thread-safe least-recently-used cache split into independently locked
+      shards, so that threads working on different keys rarely contend for
+      the same lock.
+
+      Each shard holds up to its share of `maxsize` entries and evicts on its
+      own.
+    """
+
+    def __init__(self, maxsize=1024, shards=16):
+        if maxsize < 1 or shards < 1:
+            raise ValueError("Invalid cache size '%s' or shard count '%s'" % (maxsize, shards))
+
+        shards = min(shards, maxsize)
+        self.maxsize = maxsize
+        self._shards = [LRUCache(maxsize // shards + (1 if i < maxsize % shards else 0)) for i in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def put(self, key, value):
+        self._shard(key).put(key, value)
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+    def info(self):
+        infos = [shard.info() for shard in self._shards]
+        return CacheInfo(sum(info.hits for info in infos),
+                         sum(info.misses for info in infos),
+                         sum(info.evictions for info in infos),
+                         self.maxsize,
+                         sum(info.currsize for info in infos))
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+class InternPool(object):
+    """
+      A thread-safe pool that maps equal objects onto one shared instance.
+
+      The pool only holds weak references, so interned objects are released
+      once nothing else refers to them.
+
+      :param key: A callable returning the identity key of an object.
+    """
+
+    def __init__(self, key):
+        self._key = key
+        self._pool = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def intern(self, obj):
+        key = self._key(obj)
+        with self._lock:
+            existing = self._pool.get(key)
+            if existing is None:
+                self._pool[key] = existing = obj
+            return existing
+
+    def clear(self):
+        with self._lock:
+            self._pool.clear()
+
+    def __len__(self):
+        return len(self._pool)
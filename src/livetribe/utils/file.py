@@ -14,19 +14,581 @@
 # specific language governing permissions and limitations
 # under the License.
 #
+import atexit
+import collections
 import contextlib
+import errno
+import os
+import queue
 import shutil
+import sys
 import tempfile
+import threading
+import uuid
+import weakref
+
+from livetribe.utils import instrument
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 @contextlib.contextmanager
 def temp_directory(*args, **kwargs):
     """
     Context manager returns a path created by mkdtemp and cleans it up afterwards.
+
+    The path is removed with `shutil.rmtree` unless a `cleanup` callable is
+    passed, e.g. `reap` to move the removal off the calling thread.  A
+    `template` directory is cloned into the path with `clone_tree`.  All
+    other arguments are passed on to mkdtemp.
     """
 
+    cleanup = kwargs.pop('cleanup', shutil.rmtree)
+    template = kwargs.pop('template', None)
+    started = instrument.start()
     path = tempfile.mkdtemp(*args, **kwargs)
     try:
+        try:
+            if template is not None:
+                clone_tree(template, path)
+        finally:
+            instrument.stop('temp_directory.create', started)
         yield path
     finally:
-        shutil.rmtree(path)
+        started = instrument.start()
+        try:
+            cleanup(path)
+        finally:
+            instrument.stop('temp_directory.cleanup', started)
+
+
+# Linux ioctl sharing the extents of one file with another
+FICLONE = 0x40049409
+
+CloneResult = collections.namedtuple('CloneResult', 'reflinked linked copied')
+
+# errors meaning a strategy is not available here rather than a file failing
+_UNSUPPORTED = frozenset(getattr(errno, name) for name in ('EBADF', 'EINVAL', 'ENOSYS', 'ENOTSUP', 'ENOTTY', 'EOPNOTSUPP', 'EPERM', 'EXDEV')
+                         if hasattr(errno, name))
+
+
+def clone_tree(source, destination):
+    """
+    Populate the existing directory `destination` with the contents of
+    `source` at a cost that grows with the number of files, not their size.
+
+    Files are reflinked where the filesystem supports copy-on-write clones.
+    Otherwise read-only files are hardlinked, so they share their data with
+    the source and must not be made writable, and the remaining files are
+    copied.  Symlinks are recreated as they are and the permissions of
+    directories are not copied, so the clone can always be removed.
+
+    :returns: A `CloneResult` counting the files reflinked, linked and copied.
+    """
+
+    cloner = _Cloner()
+    cloner.clone_tree(source, destination)
+    return CloneResult(cloner.reflinked, cloner.linked, cloner.copied)
+
+
+class _Cloner(object):
+    def __init__(self):
+        self.reflink = fcntl is not None and sys.platform.startswith('linux')
+        self.link = hasattr(os, 'link')
+        self.reflinked = self.linked = self.copied = 0
+
+    def clone_tree(self, source, destination):
+        for entry in os.scandir(source):
+            target = os.path.join(destination, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), target)
+            elif entry.is_dir():
+                os.mkdir(target)
+                self.clone_tree(entry.path, target)
+            else:
+                self.clone_file(entry, target)
+
+    def clone_file(self, entry, target):
+        if self.reflink:
+            try:
+                _reflink(entry.path, target)
+                shutil.copystat(entry.path, target)
+                self.reflinked += 1
+                return
+            except (IOError, OSError) as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self.reflink = False
+
+        if self.link and not entry.stat().st_mode & 0o222:
+            try:
+                os.link(entry.path, target)
+                self.linked += 1
+                return
+            except OSError as e:
+                if e.errno in _UNSUPPORTED:
+                    self.link = False
+                elif e.errno != errno.EMLINK:
+                    raise
+
+        shutil.copy2(entry.path, target)
+        self.copied += 1
+
+
+def _reflink(source, target):
+    src = os.open(source, os.O_RDONLY)
+    try:
+        dst = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(dst, FICLONE, src)
+        except BaseException:
+            os.close(dst)
+            os.unlink(target)
+            raise
+        os.close(dst)
+    finally:
+        os.close(src)
+
+
+class TempDirectoryPool(object):
+    """
+    A pool of directories handed out in place of fresh mkdtemp directories.
+
+    A released directory is emptied and kept for the next caller, which
+    spares the filesystem creating and deleting the directory itself.  The
+    most recently released directory is reused first, and once `maxsize`
+    directories are idle the least recently used one is removed.
+
+    :param maxsize: The number of idle directories to keep.
+    :param prefill: The number of directories to create up front.
+    :param dir: The directory to create the pool in, see `ram`.
+    :param prefix: The prefix of the directory names.
+    :param ram: Place the pool on the RAM-backed /dev/shm when `dir` is not
+      given and /dev/shm exists.
+    :param cleanup: The callable that removes evicted directories.
+    """
+
+    def __init__(self, maxsize=8, prefill=0, dir=None, prefix='tmp', ram=False, cleanup=shutil.rmtree):
+        if maxsize < 1:
+            raise ValueError("Invalid pool size '%s'" % maxsize)
+
+        if dir is None and ram and os.path.isdir('/dev/shm'):
+            dir = '/dev/shm'
+
+        self.maxsize = maxsize
+        self.dir = dir
+        self.prefix = prefix
+        self._cleanup = cleanup
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for _ in range(min(prefill, maxsize)):
+            self._idle.append(tempfile.mkdtemp(prefix=prefix, dir=dir))
+
+    def acquire(self):
+        """ Return an empty directory, reusing an idle one if there is one. """
+
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return tempfile.mkdtemp(prefix=self.prefix, dir=self.dir)
+
+    def release(self, path):
+        """
+        Empty `path` and return it to the pool.  A directory that cannot be
+        emptied, or is released after `close`, is removed instead.
+        """
+
+        if not self._closed:
+            try:
+                _scrub(path)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    if not self._closed:
+                        self._idle.append(path)
+                        path = self._idle.popleft() if len(self._idle) > self.maxsize else None
+        if path is not None:
+            self._cleanup(path)
+
+    @contextlib.contextmanager
+    def temp_directory(self, *args, **kwargs):
+        """
+        Context manager returns a pooled path and returns it to the pool afterwards.
+
+        It takes the arguments of mkdtemp, like `temp_directory`.  Pooled
+        directories are already named, so a `suffix`, or a `prefix` or `dir`
+        other than the pool's, gets a fresh mkdtemp directory instead, which
+        is removed with the pool's `cleanup` rather than pooled.
+        """
+
+        suffix, prefix, dir = _mkdtemp_arguments(*args, **kwargs)
+        if not suffix and prefix in (None, self.prefix) and dir in (None, self.dir):
+            path = self.acquire()
+            release = self.release
+        else:
+            path = tempfile.mkdtemp(suffix, prefix, dir)
+            release = self._cleanup
+        try:
+            yield path
+        finally:
+            release(path)
+
+    def close(self):
+        """
+        Remove every idle directory.  Directories still in use are removed
+        when they are released.
+        """
+
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for path in idle:
+            self._cleanup(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._idle)
+
+
+def _mkdtemp_arguments(suffix=None, prefix=None, dir=None):
+    return suffix, prefix, dir
+
+
+def _scrub(path):
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+
+class Reaper(object):
+    """
+    Removes directories on a background thread.
+
+    A directory handed to `reap` is first renamed to a trash name next to it,
+    which is atomic and immediate, and then queued for removal.  Once
+    `maxsize` directories are waiting, `reap` blocks until the thread catches
+    up.  Directories still queued when the interpreter exits are removed
+    before it does.
+
+    A removal that fails on the thread leaves its trash directory behind.
+    The trash path and the exception info are appended to `failures`, which
+    keeps the last 256, and passed to `onerror`, if given, so that callers
+    can retry or report them.
+    A directory that cannot be renamed is removed in `reap` itself, which
+    raises if that fails.
+
+    :param maxsize: The number of directories that may wait for removal.
+    :param remove: The callable that removes a renamed directory.
+    :param onerror: An optional callable receiving the trash path and the
+      `sys.exc_info()` of a failed removal, called on the reaper thread.
+    """
+
+    def __init__(self, maxsize=64, remove=None, onerror=None):
+        self._queue = queue.Queue(maxsize)
+        self._remove = remove or shutil.rmtree
+        self._onerror = onerror
+        self._lock = threading.Lock()
+        self._thread = None
+        self.failures = collections.deque(maxlen=256)
+
+    def reap(self, path):
+        trash = os.path.join(os.path.dirname(path) or os.curdir, '.trash-%s' % uuid.uuid4().hex)
+        try:
+            os.rename(path, trash)
+        except OSError:
+            # cannot be renamed in place, remove it the slow way
+            self._remove(path)
+            return
+
+        self._start()
+        self._queue.put(trash)
+
+    def flush(self):
+        """ Wait until every queued directory has been removed. """
+
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    # the thread must not hold the reaper, which stops it once collected
+                    thread = threading.Thread(target=_reap_queue, args=(self._queue, self._remove, self._onerror, self.failures), name='livetribe-reaper')
+                    thread.daemon = True
+                    thread.start()
+                    weakref.finalize(self, self._queue.put, None)
+                    _reapers.add(self)
+                    self._thread = thread
+
+
+def _reap_queue(paths, remove, onerror, failures):
+    while True:
+        path = paths.get()
+        if path is None:
+            paths.task_done()
+            return
+        try:
+            remove(path)
+        except Exception:
+            # keep the reaper alive, the trash is left behind for the caller
+            exc_info = sys.exc_info()
+            failures.append((path, exc_info))
+            if onerror is not None:
+                try:
+                    onerror(path, exc_info)
+                except Exception:
+                    pass
+        finally:
+            paths.task_done()
+
+
+_reapers = weakref.WeakSet()
+
+
+def _flush_reapers():
+    for reaper in list(_reapers):
+        reaper.flush()
+
+
+atexit.register(_flush_reapers)
+
+
+_reaper = Reaper()
+
+
+def reap(path):
+    """
+    Rename `path` out of the way and remove it on the shared background
+    `Reaper`, returning at once.
+    """
+
+    _reaper.reap(path)
+
+
+def flush_reaper():
+    """ Wait until the shared background `Reaper` has removed everything queued. """
+
+    _reaper.flush()
+
+
+_supports_dir_fd = (os.open in os.supports_dir_fd and os.unlink in os.supports_dir_fd and os.rmdir in os.supports_dir_fd
+                    and os.scandir in os.supports_fd)
+
+_DIRECTORY_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_NOFOLLOW', 0)
+
+# files of a directory are unlinked on the pool in batches of this size
+_UNLINK_BATCH = 512
+
+# once this many directories are open, subdirectories are removed inline
+_MAX_OPEN_DIRECTORIES = 256
+
+_executor = []
+_executor_lock = threading.Lock()
+
+
+def parallel_rmtree(path, ignore_errors=False, onerror=None, executor=None):
+    """
+    Delete a directory tree like `shutil.rmtree`, spreading the work over a thread pool.
+
+    Directories are listed with `os.scandir` and their entries are removed
+    relative to an open descriptor of the directory, so paths are not
+    resolved again for every file and symlinks are never followed.  Large
+    directories are unlinked in batches on several threads at once.  On
+    platforms without descriptor-relative calls this is `shutil.rmtree`.
+
+    Errors are gathered while the tree is removed, and a directory whose
+    contents could not all be removed is left in place.  Afterwards the
+    errors are ignored if `ignore_errors` is true, passed one by one to
+    `onerror(function, path, exc_info)` if it is given and otherwise the
+    first of them is raised.
+
+    :param executor: An optional `concurrent.futures.Executor` to remove the
+      tree in, by default a shared pool.  It must not be called from one of
+      the executor's own threads.
+    """
+
+    if not _supports_dir_fd:
+        shutil.rmtree(path, ignore_errors, onerror)
+        return
+
+    removal = _Removal(executor or _default_executor())
+    removal.run(path)
+
+    if ignore_errors:
+        return
+    for function, failed_path, exc_info in removal.errors:
+        if onerror is None:
+            raise exc_info[1]
+        onerror(function, failed_path, exc_info)
+
+
+def _default_executor():
+    if not _executor:
+        with _executor_lock:
+            if not _executor:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor.append(ThreadPoolExecutor(8))
+    return _executor[0]
+
+
+class _Directory(object):
+    __slots__ = ('path', 'fd', 'parent', 'pending', 'failed')
+
+    def __init__(self, path, fd, parent):
+        self.path = path
+        # opened when the directory is listed
+        self.fd = fd
+        self.parent = parent
+        # the listing of the directory counts as pending until it is done
+        self.pending = 1
+        self.failed = False
+
+
+class _Removal(object):
+    """
+    One run of `parallel_rmtree`.  Every directory counts its pending
+    subdirectories and unlink batches and is removed by whichever thread
+    completes the last of them.  Subdirectories that are not handed to the
+    executor are walked depth first from an explicit stack, so deep trees
+    do not recurse.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._open = 0
+        self.errors = []
+
+    def run(self, path):
+        try:
+            fd = os.open(path, _DIRECTORY_FLAGS)
+        except OSError:
+            self._error(os.open, path, None)
+            return
+
+        self._open = 1
+        self._walk(_Directory(path, fd, None))
+        self._done.wait()
+
+    def _walk(self, directory):
+        stack = [directory]
+        while stack:
+            self._call(self._list, stack.pop(), stack)
+
+    def _call(self, func, directory, *args):
+        try:
+            func(directory, *args)
+        except Exception:
+            self._error(func, directory.path, directory)
+        finally:
+            self._finish(directory)
+
+    def _submit(self, func, *args):
+        try:
+            self._executor.submit(func, *args)
+        except RuntimeError:
+            # the executor has been shut down
+            return False
+        return True
+
+    def _list(self, directory, stack):
+        if directory.fd is None:
+            try:
+                directory.fd = os.open(os.path.basename(directory.path), _DIRECTORY_FLAGS, dir_fd=directory.parent.fd)
+            except OSError:
+                self._error(os.open, directory.path, directory)
+                return
+            with self._lock:
+                self._open += 1
+
+        try:
+            entries = list(os.scandir(directory.fd))
+        except OSError:
+            self._error(os.scandir, directory.path, directory)
+            return
+
+        files = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                files.append(entry.name)
+                continue
+
+            child = _Directory(os.path.join(directory.path, entry.name), None, directory)
+            with self._lock:
+                directory.pending += 1
+                inline = self._open >= _MAX_OPEN_DIRECTORIES
+            if inline or not self._submit(self._walk, child):
+                stack.append(child)
+
+        for start in range(_UNLINK_BATCH, len(files), _UNLINK_BATCH):
+            batch = files[start:start + _UNLINK_BATCH]
+            with self._lock:
+                directory.pending += 1
+            if not self._submit(self._call, self._unlink, directory, batch):
+                self._call(self._unlink, directory, batch)
+        self._unlink(directory, files[:_UNLINK_BATCH])
+
+    def _unlink(self, directory, names):
+        fd = directory.fd
+        for name in names:
+            try:
+                os.unlink(name, dir_fd=fd)
+            except OSError:
+                self._error(os.unlink, os.path.join(directory.path, name), directory)
+
+    def _finish(self, directory):
+        while directory is not None:
+            with self._lock:
+                directory.pending -= 1
+                if directory.pending:
+                    return
+                if directory.fd is not None:
+                    self._open -= 1
+
+            if directory.fd is not None:
+                try:
+                    os.close(directory.fd)
+                except OSError:
+                    self._error(os.close, directory.path, None)
+            parent = directory.parent
+            if directory.failed:
+                if parent is not None:
+                    parent.failed = True
+            else:
+                try:
+                    if parent is None:
+                        os.rmdir(directory.path)
+                    else:
+                        os.rmdir(os.path.basename(directory.path), dir_fd=parent.fd)
+                except OSError:
+                    self._error(os.rmdir, directory.path, parent)
+
+            if parent is None:
+                self._done.set()
+            directory = parent
+
+    def _error(self, function, path, directory):
+        with self._lock:
+            self.errors.append((function, path, sys.exc_info()))
+            if directory is not None:
+                directory.failed = True
@@ -0,0 +1,223 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+"""
+  Opt-in call counters, timings and latency histograms for the hot paths of
+  `livetribe.utils`.
+
+  Instrumentation is off until `enable` is called.  The hot methods,
+  `StandardVersion.parse`, its comparisons and `VersionRange.contains`, are
+  only wrapped while it is enabled, so they cost nothing otherwise; the
+  module functions `ensure_version`, `version_for_package` and
+  `temp_directory` check a flag on every call.
+
+  Metrics are named after what they time:
+
+  - ``StandardVersion.parse``
+  - ``StandardVersion.compare``, for `__cmp__` and the rich comparisons
+  - ``VersionRange.contains``
+  - ``ensure_version``
+  - ``version_for_package``
+  - ``temp_directory.create`` and ``temp_directory.cleanup``
+"""
+
+from bisect import bisect_left
+import collections
+import functools
+import threading
+import time
+
+
+_clock = time.perf_counter
+
+# upper bounds, in seconds, of the latency histogram buckets; a last bucket
+# counts everything slower
+BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+MetricSnapshot = collections.namedtuple('MetricSnapshot', 'count total min max histogram')
+
+_enabled = False
+_lock = threading.Lock()
+_metrics = {}
+_exporter = [None, None]
+_patched = []
+
+
+class _Metric(object):
+    __slots__ = ('count', 'total', 'min', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def snapshot(self):
+        return MetricSnapshot(self.count, self.total, self.min, self.max, tuple(self.histogram))
+
+
+def record(name, seconds):
+    """ Record one call of `name` that took `seconds`. """
+
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = _Metric()
+        metric.count += 1
+        metric.total += seconds
+        if metric.min is None or seconds < metric.min:
+            metric.min = seconds
+        if metric.max is None or seconds > metric.max:
+            metric.max = seconds
+        metric.histogram[bisect_left(BUCKETS, seconds)] += 1
+
+
+def start():
+    """ Return a start time to pass to `stop`, or None when disabled. """
+
+    return _clock() if _enabled else None
+
+
+def stop(name, started):
+    """ Record the time since `started` unless it is None. """
+
+    if started is not None:
+        record(name, _clock() - started)
+
+
+def instrumented(name):
+    """ Decorate a function to record its calls as `name` while enabled. """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = _clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, _clock() - started)
+
+        return wrapper
+
+    return decorate
+
+
+def _timed(name, func):
+    def wrapper(*args, **kwargs):
+        started = _clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, _clock() - started)
+
+    return functools.update_wrapper(wrapper, func)
+
+
+def _methods():
+    from livetribe.utils.version import StandardVersion, VersionRange
+
+    methods = [(StandardVersion, 'parse', 'StandardVersion.parse'), (VersionRange, 'contains', 'VersionRange.contains')]
+    for method in ('__cmp__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__'):
+        methods.append((StandardVersion, method, 'StandardVersion.compare'))
+    return methods
+
+
+def enable(exporter=None, interval=None):
+    """
+      Start recording metrics.
+
+      :param exporter: An optional callable receiving the result of
+        `snapshot`, called by `export` and when instrumentation is disabled.
+      :param interval: Call `export` every `interval` seconds on a daemon
+        thread.
+    """
+
+    global _enabled
+
+    with _lock:
+        if not _patched:
+            for cls, attribute, name in _methods():
+                original = cls.__dict__[attribute]
+                if isinstance(original, classmethod):
+                    wrapped = classmethod(_timed(name, original.__func__))
+                else:
+                    wrapped = _timed(name, original)
+                setattr(cls, attribute, wrapped)
+                _patched.append((cls, attribute, original))
+
+        _exporter[0] = exporter
+        if _exporter[1] is not None:
+            _exporter[1].set()
+            _exporter[1] = None
+        if exporter is not None and interval:
+            stopped = _exporter[1] = threading.Event()
+            thread = threading.Thread(target=_export_every, args=(interval, stopped), name='livetribe-instrument')
+            thread.daemon = True
+            thread.start()
+
+        _enabled = True
+
+
+def disable():
+    """ Stop recording metrics and hand a last snapshot to the exporter. """
+
+    global _enabled
+
+    with _lock:
+        _enabled = False
+        while _patched:
+            cls, attribute, original = _patched.pop()
+            setattr(cls, attribute, original)
+        if _exporter[1] is not None:
+            _exporter[1].set()
+            _exporter[1] = None
+
+    export()
+    _exporter[0] = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def snapshot():
+    """ Return a `dict` mapping metric names to their `MetricSnapshot`. """
+
+    with _lock:
+        return dict((name, metric.snapshot()) for name, metric in _metrics.items())
+
+
+def reset():
+    """ Forget every recorded metric. """
+
+    with _lock:
+        _metrics.clear()
+
+
+def export():
+    """ Hand a snapshot to the exporter, if there is one. """
+
+    exporter = _exporter[0]
+    if exporter is not None:
+        exporter(snapshot())
+
+
+def _export_every(interval, stopped):
+    while not stopped.wait(interval):
+        export()
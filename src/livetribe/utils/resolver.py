@@ -0,0 +1,225 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+""" Dependency resolution over version range constraints. """
+
+import collections
+
+from livetribe.utils.version import compile_requirement, StandardVersion
+
+
+Constraint = collections.namedtuple('Constraint', 'source package versions')
+Constraint.__doc__ = """
+  A requirement that `package` has a version in `versions`.  `source` is the
+  (package, version) whose dependency imposes it, or None for a requirement
+  given to `Resolver.resolve`.
+"""
+
+
+class ResolutionError(Exception):
+    """
+      Raised when no consistent set of versions exists.  `conflicts` holds a
+      minimal list of the given requirements that cannot be satisfied
+      together.
+    """
+
+    def __init__(self, conflicts):
+        Exception.__init__(self, 'Conflicting requirements: %s' % ', '.join('%s %s' % (c.package, c.versions) for c in conflicts))
+        self.conflicts = conflicts
+
+
+def _version(version):
+    return version if isinstance(version, StandardVersion) else StandardVersion.parse(version)
+
+
+def _blame(constraint):
+    return constraint.source[0] if constraint.source is not None else constraint
+
+
+class Resolver(object):
+    """
+      Picks the highest consistent version of every package that a set of
+      requirements needs.
+
+      The search assigns one package at a time, most constrained first, and
+      tries its versions from the highest down.  Each candidate is checked
+      against the versions already picked and the remaining candidates of its
+      dependencies.  When every version of a package fails, the search jumps
+      straight back to the most recent decision involved in the conflict, and
+      the combination of decisions is remembered so that it is never explored
+      again, including by later calls to `resolve`.
+
+      :param candidates: A mapping of package name to its available versions,
+        as `StandardVersion`s or `str`s.
+      :param dependencies: A mapping of (package, version) to a mapping, or
+        iterable of pairs, of dependency name to the versions it accepts, in
+        any form taken by `compile_requirement`.
+    """
+
+    def __init__(self, candidates, dependencies=None):
+        self._candidates = {}
+        for package, versions in candidates.items():
+            self._candidates[package] = sorted(set(_version(v) for v in versions), reverse=True)
+
+        self._dependencies = {}
+        for (package, version), requirements in (dependencies or {}).items():
+            if hasattr(requirements, 'items'):
+                requirements = requirements.items()
+            version = _version(version)
+            self._dependencies[(package, version)] = [(Constraint((package, version), dependency, versions), compile_requirement(versions))
+                                                      for dependency, versions in requirements]
+
+        self._nogoods = collections.defaultdict(list)
+
+    def resolve(self, requirements):
+        """
+          Resolve a set of requirements.
+
+          :param requirements: A mapping, or iterable of pairs, of package name
+            to the versions it accepts.
+          :returns: A `dict` of package name to the chosen `StandardVersion`.
+          :raises ResolutionError: if the requirements cannot be satisfied.
+        """
+
+        if hasattr(requirements, 'items'):
+            requirements = requirements.items()
+        roots = [(Constraint(None, package, versions), compile_requirement(versions)) for package, versions in requirements]
+
+        solution, conflict = _Search(self, roots).run()
+        if solution is None:
+            raise ResolutionError(self._minimize([root for root in roots if root[0] in conflict]))
+        return solution
+
+    def _minimize(self, roots):
+        core = list(roots)
+        i = 0
+        while i < len(core):
+            trial = core[:i] + core[i + 1:]
+            if _Search(self, trial).run()[0] is None:
+                core = trial
+            else:
+                i += 1
+        return [constraint for constraint, matcher in core]
+
+
+class _Search(object):
+    """ The state of one conflict-directed backjumping search. """
+
+    def __init__(self, resolver, roots):
+        self.candidates = resolver._candidates
+        self.dependencies = resolver._dependencies
+        self.nogoods = resolver._nogoods
+        self.roots = set(constraint for constraint, matcher in roots)
+        self.assignment = {}
+        self.depth = {}
+        self.active = collections.defaultdict(list)
+        for root in roots:
+            self.active[root[0].package].append(root)
+
+    def run(self):
+        return self._search()
+
+    def _viable(self, package, extra=None):
+        constraints = self.active.get(package, ())
+        for version in self.candidates.get(package, ()):
+            if (extra is None or extra(version)) and all(matcher(version) for constraint, matcher in constraints):
+                yield version
+
+    def _select(self):
+        best = None
+        best_count = None
+        for package in sorted(self.active):
+            if package in self.assignment:
+                continue
+            count = sum(1 for version in self._viable(package))
+            if best is None or count < best_count:
+                best, best_count = package, count
+                if count == 0:
+                    break
+        return best
+
+    def _check(self, package, version):
+        """ Return the set of decisions that rule out `version`, or None if it is consistent. """
+
+        for constraint, matcher in self.active[package]:
+            if not matcher(version):
+                return set([_blame(constraint)])
+
+        for pairs, roots in self.nogoods.get((package, version), ()):
+            if roots <= self.roots and all(p == package or self.assignment.get(p) == v for p, v in pairs):
+                return set(p for p, v in pairs if p != package) | roots
+
+        for constraint, matcher in self.dependencies.get((package, version), ()):
+            dependency = constraint.package
+            if dependency in self.assignment:
+                if not matcher(self.assignment[dependency]):
+                    return set([dependency])
+            elif dependency != package:
+                for viable in self._viable(dependency, matcher):
+                    break
+                else:
+                    return set(_blame(other) for other, other_matcher in self.active.get(dependency, ()))
+        return None
+
+    def _assign(self, package, version):
+        self.assignment[package] = version
+        self.depth[package] = len(self.depth)
+        for constraint, matcher in self.dependencies.get((package, version), ()):
+            self.active[constraint.package].append((constraint, matcher))
+
+    def _unassign(self, package, version):
+        for constraint, matcher in reversed(self.dependencies.get((package, version), ())):
+            constraints = self.active[constraint.package]
+            constraints.pop()
+            if not constraints:
+                del self.active[constraint.package]
+        del self.assignment[package]
+        del self.depth[package]
+
+    def _learn(self, conflict):
+        pairs = frozenset((p, self.assignment[p]) for p in conflict if p in self.assignment)
+        if pairs:
+            roots = frozenset(blame for blame in conflict if blame not in self.assignment)
+            latest = max(pairs, key=lambda pair: self.depth[pair[0]])
+            self.nogoods[latest].append((pairs, roots))
+
+    def _search(self):
+        package = self._select()
+        if package is None:
+            return dict(self.assignment), None
+
+        conflict = set()
+        for version in self.candidates.get(package, ()):
+            blame = self._check(package, version)
+            if blame is not None:
+                conflict |= blame
+                continue
+
+            self._assign(package, version)
+            solution, failure = self._search()
+            self._unassign(package, version)
+
+            if solution is not None:
+                return solution, None
+            if package not in failure:
+                return None, failure
+            conflict |= failure
+
+        # the package is only needed because of the constraints on it
+        conflict.discard(package)
+        conflict.update(_blame(constraint) for constraint, matcher in self.active[package])
+        self._learn(conflict)
+        return None, conflict
@@ -14,18 +14,149 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-""" Version handling classes & methods. """
+"""
+  Version handling classes & methods.
 
+  Thread safety: `StandardVersion`, `VersionRange`, `VersionSet`,
+  `RangeMatcher` and `VersionArray` are immutable and may be shared freely
+  between threads.  The parse, matcher and qualifier caches are safe to use
+  concurrently, on free-threaded builds too; the parse and matcher caches
+  are sharded so that threads rarely wait on the same lock.  `VersionIndex`
+  must not be mutated while other threads use it, while `VersionRangeIndex`
+  may be updated and queried concurrently.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import collections
+import heapq
+import mmap
+import operator
+import os
 import re
-import pkg_resources
+import struct
+import sys
+import threading
+
+from livetribe.utils import instrument
+from livetribe.utils.cache import InternPool, LRUCache, ShardedLRUCache
+
+
+def _installed_distributions():
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        return [(dist.project_name, dist.version) for dist in pkg_resources.WorkingSet()]
+
+    return [(dist.metadata['Name'], dist.version) for dist in metadata.distributions()]
+
+
+def _normalize_name(package):
+    return re.sub(r'[-_.]+', '-', package).lower()
+
+
+def _path_fingerprint():
+    fingerprint = []
+    for entry in sys.path:
+        try:
+            fingerprint.append((entry, os.stat(entry or '.').st_mtime))
+        except (OSError, TypeError):
+            fingerprint.append((entry, None))
+    return tuple(fingerprint)
+
+
+class _DistributionSnapshot(object):
+    """
+      The versions of all installed distributions, read once and reused until
+      `sys.path` or the modification time of one of its entries changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._versions = {}
+        self._parsed = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._fingerprint = None
 
+    def _current(self):
+        fingerprint = _path_fingerprint()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                versions = {}
+                for name, version in _installed_distributions():
+                    if name:
+                        versions.setdefault(_normalize_name(name), version)
+                self._versions = versions
+                self._parsed = {}
+                self._fingerprint = fingerprint
+            return self._versions, self._parsed
 
+    def version(self, package):
+        versions, parsed = self._current()
+        try:
+            return versions[_normalize_name(package)]
+        except KeyError:
+            raise LookupError("Package '%s' is not installed" % package)
+
+    def parsed_versions(self, packages):
+        versions, parsed = self._current()
+        result = {}
+        for package in packages:
+            name = _normalize_name(package)
+            try:
+                result[package] = parsed[name]
+            except KeyError:
+                try:
+                    version = StandardVersion.parse(versions[name])
+                except (KeyError, ValueError):
+                    version = None
+                result[package] = parsed[name] = version
+        return result
+
+
+_distributions = _DistributionSnapshot()
+
+
+@instrument.instrumented('version_for_package')
 def version_for_package(package):
-    """ Return the version for a given Python package name. """
+    """
+      Return the version for a given Python package name.
+
+      Installed versions are read from a snapshot of the distribution
+      metadata which is rebuilt when `sys.path`, or the modification time of
+      one of its entries, changes.  The metadata backend is imported on first
+      use; `importlib.metadata` is preferred and `pkg_resources` is used where
+      it is unavailable.
+
+      :raises LookupError: if the package is not installed.
+    """
+
+    return _distributions.version(package)
+
+
+def versions_for_packages(packages):
+    """
+      Return the versions of many Python packages at once.
+
+      :param packages: An iterable of package names.
+      :returns: A `dict` mapping each name to its `StandardVersion`, or to None
+        if the package is not installed or its version is not a standard one.
+    """
+
+    return _distributions.parsed_versions(packages)
+
+
+def invalidate_distributions():
+    """ Discard the installed distribution snapshot, e.g. after installing packages in-process. """
 
-    return pkg_resources.get_distribution(package).version
+    _distributions.invalidate()
 
 
+@instrument.instrumented('ensure_version')
 def ensure_version(given, expected):
     """
       Helper to check a version against an expected version.
@@ -43,26 +174,381 @@ def ensure_version(given, expected):
     return True, str(expected_version)
 
 
+ParseResult = collections.namedtuple('ParseResult', 'versions invalid')
+
+
+def _parse_chunk(cls, version_strings, offset):
+    match = cls._version_re.match
+    versions = []
+    invalid = array('l')
+    append = versions.append
+
+    for index, version_string in enumerate(version_strings, offset):
+        try:
+            m = match(version_string)
+        except TypeError:
+            m = None
+        if m is None:
+            append(None)
+            invalid.append(index)
+            continue
+
+        (major, minor, patch, qualifier) = m.group(1, 3, 5, 7)
+        append(cls(int(major), int(minor or 0), int(patch or 0), qualifier))
+
+    return versions, invalid
+
+
 class Version(object):
     """
       Abstract base class for version numbering classes.  Just provides
       __init__ and __repr__, because those seem to be the same for all version
       numbering classes.
     """
-    pass
+
+    __slots__ = ()
+
+
+# The version grammar shared by every parser and the scanner, in verbose
+# syntax.  Groups 1, 3, 5 and 7 of _version_pattern are the major, minor and
+# patch numbers and the qualifier.
+_numbers_pattern = r'(\d+) (\. (\d+) (\. (\d+))?)?'
+_qualifier_class = r'[a-zA-Z0-9_\.\-]'
+_version_pattern = _numbers_pattern + r' (-(' + _qualifier_class + r'+))?'
+
+_qualifier_token_re = re.compile(r'\d+|[a-zA-Z]+')
+
+_qualifier_keys = {}
+_missing = object()
+
+
+def _qualifier_key(cls, qualifier):
+    """
+      Split a qualifier into a tuple of typed tokens.  Well-known labels sort
+      by their precedence and before other words, which sort before numbers;
+      numbers compare numerically.  A lone label of the class's
+      `release_rank` names the release itself and returns None.
+    """
+
+    key = _qualifier_keys.get((cls, qualifier), _missing)
+    if key is _missing:
+        precedence = cls.qualifier_precedence
+        tokens = []
+        for token in _qualifier_token_re.findall(qualifier):
+            if token.isdigit():
+                tokens.append((2, int(token), ''))
+            else:
+                rank = precedence.get(token.lower())
+                tokens.append((0, rank, '') if rank is not None else (1, 0, token))
+        key = tuple(tokens)
+        if len(key) == 1 and key[0] == (0, cls.release_rank, ''):
+            key = None
+
+        if len(_qualifier_keys) > 4096:
+            _qualifier_keys.clear()
+        _qualifier_keys[(cls, qualifier)] = key
+    return key
+
+
+# Layout of the packed keys: an 8 byte big-endian prefix in which major, minor
+# and patch take 16 bits each above a 16 bit qualifier rank, followed by a
+# tail for qualifiers the rank cannot hold.  A rank holds a label's precedence
+# + 1 above an 11 bit number + 1, and all ones means no qualifier at all.  The
+# rank of an empty qualifier is 0, and qualifiers led by a number too large for
+# the rank, a label ranked too high, a word or a number sort in the overflow
+# ranks above the labels.
+_PACKED_FIELD_MAX = 0xFFFF
+_PACKED_NO_QUALIFIER = 0xFFFF
+_PACKED_LABEL_SHIFT = 11
+_PACKED_LABEL_MAX = 14
+_PACKED_NUMBER_MAX = (1 << _PACKED_LABEL_SHIFT) - 3
+_PACKED_NUMBER_OVERFLOW = (1 << _PACKED_LABEL_SHIFT) - 1
+_PACKED_OVERFLOW = 0x8000
+
+_packed_prefix = struct.Struct('>HHHH')
+
+
+def _qualifier_rank(tokens):
+    """
+      Return the rank of a qualifier's tokens and the tail of those the rank
+      does not hold.  A lone label, or a label and a number, has no tail.
+    """
+
+    if not tokens:
+        return 0, b''
+    kind, value, _ = tokens[0]
+    if kind != 0 or value > _PACKED_LABEL_MAX:
+        return _PACKED_OVERFLOW + kind, _pack_tokens(tokens)
+
+    rank = (value + 1) << _PACKED_LABEL_SHIFT
+    rest = tokens[1:]
+    if rest and rest[0][0] == 2:
+        if rest[0][1] <= _PACKED_NUMBER_MAX:
+            rank |= rest[0][1] + 1
+            rest = rest[1:]
+        else:
+            rank |= _PACKED_NUMBER_OVERFLOW
+    return rank, _pack_tokens(rest)
+
+
+def _pack_tokens(tokens):
+    """
+      Encode qualifier tokens so that the bytes sort like the tokens: a tag
+      byte per token, then a word ending in a zero byte or a number's length
+      and big-endian bytes.
+    """
+
+    packed = bytearray()
+    for kind, value, word in tokens:
+        packed.append(kind + 1)
+        if kind == 1:
+            packed += word.encode('ascii')
+            packed.append(0)
+        else:
+            size = (value.bit_length() + 7) // 8
+            if size > 0xFF:
+                raise OverflowError('Qualifier number %s cannot be packed into a key' % value)
+            packed.append(size)
+            packed += value.to_bytes(size, 'big')
+    return bytes(packed)
 
 
+def _unpack_tokens(packed):
+    tokens = []
+    i = 0
+    while i < len(packed):
+        tag = packed[i]
+        if tag == 2:
+            end = packed.index(0, i + 1)
+            tokens.append((1, 0, packed[i + 1:end].decode('ascii')))
+            i = end + 1
+        elif tag == 1 or tag == 3:
+            end = i + 2 + packed[i + 1]
+            if end > len(packed):
+                raise ValueError('Truncated qualifier number')
+            tokens.append((tag - 1, int.from_bytes(packed[i + 2:end], 'big'), ''))
+            i = end
+        else:
+            raise ValueError('Invalid qualifier tag %s' % tag)
+    return tokens
+
+
+def _buffer_stop(buffer, offset, length):
+    """ Return the end of a field in a buffer, which must lie inside it. """
+
+    end = len(buffer)
+    stop = end if length is None else offset + length
+    if offset < 0 or stop < offset or stop > end:
+        raise ValueError('Field of length %s at offset %d lies outside a buffer of %d bytes' % (length, offset, end))
+    return stop
+
+
+_label_names = {}
+
 class StandardVersion(Version):
-    """ Represents a standard version. """
+    """
+      Represents a standard version.
 
-    _version_re = re.compile(r'^(\d+) (\. (\d+) (\. (\d+))?)? (-([a-zA-Z0-9_\.\-]+))?$', re.VERBOSE)
+      Versions are immutable.  A sort key is computed once at construction and
+      every comparison is a single comparison of those keys; a version without
+      a qualifier is greater than the same version with one.
+
+      Qualifiers are split into numeric and alphanumeric tokens, so ``RC2``
+      sorts before ``RC10`` and ``rc.2`` equals ``RC2``.  Labels listed in
+      `qualifier_precedence` sort by their rank and before any other word;
+      subclasses may override it to change the ranking.  A qualifier that is
+      just a label of `release_rank`, such as ``GA``, names the release
+      itself, so ``1.0-GA`` equals ``1.0``.
+    """
+
+    __slots__ = ('_key', '_qualifier', '_hash', '__weakref__')
+
+    _version_re = re.compile(r'^' + _version_pattern + r'$', re.VERBOSE)
+    _version_bytes_re = re.compile(_version_pattern.encode('ascii'), re.VERBOSE)
+
+    _cache = None
+
+    #: Lower-case well-known qualifier labels mapped to their rank.
+    qualifier_precedence = {
+        'dev': 0,
+        'alpha': 1,
+        'beta': 2,
+        'milestone': 3,
+        'rc': 4, 'cr': 4,
+        'snapshot': 5,
+        'ga': 6, 'final': 6, 'release': 6,
+    }
+
+    #: The rank in `qualifier_precedence` of labels naming the release itself.
+    release_rank = 6
 
     def __init__(self, major, minor=None, patch=None, qualifier=None):
-        self.version = (major, minor or 0, patch or 0)
-        self.qualifier = qualifier
+        tokens = _qualifier_key(self.__class__, qualifier) if qualifier else None
+        if tokens is None:
+            key = (major, minor or 0, patch or 0, 1, ())
+        else:
+            key = (major, minor or 0, patch or 0, 0, tokens)
+
+        _set_key(self, key)
+        _set_qualifier(self, qualifier)
+        _set_hash(self, hash(key))
+
+    @classmethod
+    def enable_cache(cls, maxsize=1024, shards=16):
+        """
+          Cache the results of `parse` and intern the versions it returns.
+
+          Repeat parses of a cached string skip the regex and equal versions
+          share one instance.  Each class has its own cache, so subclasses
+          are not affected.
+
+          :param maxsize: The number of version strings to remember.
+          :param shards: The number of independently locked cache shards.
+        """
+
+        cls._cache = (ShardedLRUCache(maxsize, shards), InternPool(lambda version: (version._key, version._qualifier)))
+
+    @classmethod
+    def disable_cache(cls):
+        cls._cache = None
+
+    @classmethod
+    def cache_info(cls):
+        """
+          :returns: A `CacheInfo` for the parse cache or None if it is disabled.
+        """
+
+        cached = cls.__dict__.get('_cache')
+        return cached[0].info() if cached is not None else None
+
+    @classmethod
+    def _intern(cls, version):
+        cached = cls.__dict__.get('_cache')
+        return cached[1].intern(version) if cached is not None else version
 
     @classmethod
     def parse(cls, version_string):
+        cached = cls.__dict__.get('_cache')
+        if cached is None:
+            return cls._parse(version_string)
+
+        lru, pool = cached
+        version = lru.get(version_string)
+        if version is None:
+            version = pool.intern(cls._parse(version_string))
+            lru.put(version_string, version)
+        return version
+
+    @classmethod
+    def parse_many(cls, version_strings, executor=None, chunksize=10000):
+        """
+          Parse an iterable of version strings in one pass.
+
+          Invalid rows do not raise; their slot in the returned versions is
+          None and their index is recorded instead.  The parse cache is not
+          consulted.
+
+          :param version_strings: An iterable of `str` versions.
+          :param executor: An optional `concurrent.futures.Executor` to spread
+            chunks of the input across.
+          :param chunksize: The number of rows handed to the executor at once.
+          :returns: A `ParseResult` of (versions, invalid) where invalid is an
+            `array` of row indices.
+        """
+
+        if executor is None:
+            return ParseResult(*_parse_chunk(cls, version_strings, 0))
+
+        futures = []
+        chunk = []
+        offset = 0
+        for version_string in version_strings:
+            chunk.append(version_string)
+            if len(chunk) == chunksize:
+                futures.append(executor.submit(_parse_chunk, cls, chunk, offset))
+                offset += chunksize
+                chunk = []
+        if chunk:
+            futures.append(executor.submit(_parse_chunk, cls, chunk, offset))
+
+        versions = []
+        invalid = array('l')
+        for future in futures:
+            chunk_versions, chunk_invalid = future.result()
+            versions.extend(chunk_versions)
+            invalid.extend(chunk_invalid)
+        return ParseResult(versions, invalid)
+
+    @classmethod
+    def parse_buffer(cls, buffer, offset=0, length=None):
+        """
+          Parse a version held in a `bytes`, `bytearray` or `memoryview`
+          without slicing or decoding the buffer.  Only a qualifier is
+          decoded, as versions keep it as a `str`.  The parse cache is not
+          consulted.
+
+          :param offset: The index of the first byte of the version.
+          :param length: The length of the version, by default up to the end
+            of the buffer.
+          :raises ValueError: if the field lies outside the buffer or is
+            invalid.
+        """
+
+        stop = _buffer_stop(buffer, offset, length)
+        match = cls._version_bytes_re.fullmatch(buffer, offset, stop)
+        if not match:
+            raise ValueError("Invalid version number %r" % bytes(buffer[offset:stop]))
+
+        (major, minor, patch, qualifier) = match.group(1, 3, 5, 7)
+
+        return cls(int(major), int(minor or 0), int(patch or 0), qualifier.decode('ascii') if qualifier else None)
+
+    @classmethod
+    def parse_packed(cls, buffer, offset=0, count=None, prefix='>H'):
+        """
+          Parse consecutive length-prefixed version fields from a buffer, as
+          `parse_buffer` does for one.
+
+          :param offset: The index of the first length prefix.
+          :param count: The number of fields to read, by default up to the
+            end of the buffer.
+          :param prefix: The `struct` format of the length prefixes.
+          :returns: A `list` of versions.
+          :raises ValueError: if a field is truncated or invalid.
+        """
+
+        _buffer_stop(buffer, offset, 0)
+        fullmatch = cls._version_bytes_re.fullmatch
+        header = struct.Struct(prefix)
+        unpack_from = header.unpack_from
+        size = header.size
+        end = len(buffer)
+        remaining = -1 if count is None else count
+        versions = []
+        append = versions.append
+
+        while remaining and (offset < end or remaining > 0):
+            start = offset + size
+            if start > end:
+                raise ValueError('Truncated version field at offset %d' % offset)
+            (length,) = unpack_from(buffer, offset)
+            stop = start + length
+            if stop > end:
+                raise ValueError('Truncated version field at offset %d' % offset)
+
+            match = fullmatch(buffer, start, stop)
+            if match is None:
+                raise ValueError("Invalid version number %r at offset %d" % (bytes(buffer[start:stop]), offset))
+
+            (major, minor, patch, qualifier) = match.group(1, 3, 5, 7)
+            append(cls(int(major), int(minor) if minor else 0, int(patch) if patch else 0, qualifier.decode('ascii') if qualifier else None))
+            offset = stop
+            remaining -= 1
+
+        return versions
+
+    @classmethod
+    def _parse(cls, version_string):
         match = cls._version_re.match(version_string)
         if not match:
             raise ValueError("Invalid version number '%s'" % version_string)
@@ -71,111 +557,588 @@ class StandardVersion(Version):
 
         return cls(int(major or 0), int(minor or 0), int(patch or 0), qualifier)
 
+    def to_key(self):
+        """
+          Return an order preserving `bytes` encoding of this version.
+
+          Equal versions share a key and keys sort like their versions, so
+          they can stand in for versions in sorted lists, hashes and messages.
+          Versions qualified by nothing, a well-known label, or a label and a
+          number below 2046 take 8 bytes, which read as a big-endian unsigned
+          integer give the same order; other qualifiers add a tail.
+
+          :raises OverflowError: if a major, minor or patch number exceeds
+            65535.
+        """
+
+        major, minor, patch, release, tokens = self._key
+        if major > _PACKED_FIELD_MAX or minor > _PACKED_FIELD_MAX or patch > _PACKED_FIELD_MAX:
+            raise OverflowError("Version '%s' cannot be packed into a key" % self)
+        if release:
+            return _packed_prefix.pack(major, minor, patch, _PACKED_NO_QUALIFIER)
+        rank, tail = _qualifier_rank(tokens)
+        return _packed_prefix.pack(major, minor, patch, rank) + tail
+
+    @classmethod
+    def from_key(cls, key):
+        """
+          Return the version encoded by `to_key`.  Labels are rebuilt from the
+          first name of their rank in `qualifier_precedence` and tokens are
+          joined by dots, so the result is equal to the original version
+          though it may be spelt differently.
+        """
+
+        try:
+            major, minor, patch, rank = _packed_prefix.unpack_from(key)
+            tokens = _unpack_tokens(key[_packed_prefix.size:])
+        except (IndexError, struct.error, ValueError):
+            raise ValueError("Invalid version key %r" % (key,))
+
+        if rank == _PACKED_NO_QUALIFIER:
+            qualifier = None
+        else:
+            if 1 << _PACKED_LABEL_SHIFT <= rank < _PACKED_OVERFLOW:
+                head = [(0, (rank >> _PACKED_LABEL_SHIFT) - 1, '')]
+                number = rank & ((1 << _PACKED_LABEL_SHIFT) - 1)
+                if number and number != _PACKED_NUMBER_OVERFLOW:
+                    head.append((2, number - 1, ''))
+                tokens = head + tokens
+
+            names = _label_names.get(cls)
+            if names is None:
+                names = {}
+                for name, label in cls.qualifier_precedence.items():
+                    names.setdefault(label, name)
+                _label_names[cls] = names
+
+            parts = []
+            for i, (kind, value, word) in enumerate(tokens):
+                if kind == 0:
+                    if value not in names:
+                        raise ValueError("Invalid version key %r" % (key,))
+                    parts.append(names[value])
+                elif kind == 1:
+                    parts.append(word)
+                elif i == 1 and tokens[0][0] == 0:
+                    # a label and its number are spelt together, like rc2
+                    parts[0] += str(value)
+                else:
+                    parts.append(str(value))
+            qualifier = '.'.join(parts) or '_'
+
+        version = cls(major, minor, patch, qualifier)
+        # only the encoding to_key gives a version is a valid key
+        if version.to_key() != key:
+            raise ValueError("Invalid version key %r" % (key,))
+        return version
+
+    @staticmethod
+    def to_keys(versions):
+        """
+          Return the list of `to_key` keys of many versions, to sort, hash or
+          ship them between processes as plain `bytes`.
+
+          :raises OverflowError: if any version cannot be packed.
+        """
+
+        return [version.to_key() for version in versions]
+
+    @classmethod
+    def from_keys(cls, keys):
+        """ Return the list of versions encoded by an iterable of packed keys. """
+
+        return [cls.from_key(key) for key in keys]
+
     def increment_major(self):
-        self._inc_ver(0)
+        """ Return a new version with the major number incremented. """
+
+        return self._inc_ver(0)
 
     def increment_minor(self):
-        self._inc_ver(1)
+        """ Return a new version with the minor number incremented. """
+
+        return self._inc_ver(1)
 
     def increment_micro(self):
-        self._inc_ver(2)
+        """ Return a new version with the micro number incremented. """
+
+        return self._inc_ver(2)
 
     def _inc_ver(self, ver_part):
-        self.version = tuple([self.version[i] + (1 if i == ver_part else 0) for i in range(len(self.version))])
+        version = [self._key[i] + (1 if i == ver_part else 0) for i in range(3)]
+        return self.__class__(version[0], version[1], version[2], self._qualifier)
+
+    @property
+    def version(self):
+        return self._key[:3]
 
+    @property
+    def qualifier(self):
+        return self._qualifier
 
     @property
     def tuple(self):
-        return self.version[0], self.version[1], self.version[2], self.qualifier
+        key = self._key
+        return key[0], key[1], key[2], self._qualifier
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __reduce__(self):
+        return self.__class__, self.tuple
 
     def __str__(self):
         major, minor, micro = self.version
         string = str(major) + '.' + str(minor)
         if micro:
             string += '.' + str(micro)
-        if self.qualifier:
-            string += '-' + str(self.qualifier)
+        if self._qualifier:
+            string += '-' + str(self._qualifier)
         return string
 
     def __repr__(self):
         return 'StandardVersion(%r, %r, %r, %r)' % self.tuple
 
+    def _other_key(self, other):
+        if isinstance(other, str):
+            return self.parse(other)._key
+        return None
+
     def __eq__(self, other):
-        return self.__cmp__(other) == 0
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key == key
+
+    def __ne__(self, other):
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key != key
 
     def __lt__(self, other):
-        return self.__cmp__(other) < 0
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key < key
+
+    def __le__(self, other):
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key <= key
+
+    def __gt__(self, other):
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key > key
+
+    def __ge__(self, other):
+        try:
+            key = other._key
+        except AttributeError:
+            key = self._other_key(other)
+            if key is None:
+                return NotImplemented
+        return self._key >= key
 
     def __cmp__(self, other):
-        if isinstance(other, str):
-            other = StandardVersion.parse(other)
-
-        # numeric versions don't match -- qualifier stuff doesn't matter
-        if self.version < other.version:
-            return -1
-        elif self.version > other.version:
-            return 1
-
-        # case 1: neither has qualifier; they're equal
-        # case 2: self has qualifier, other doesn't; other is greater
-        # case 3: self doesn't have qualifier, other does: self is greater
-        # case 4: both have qualifier: must compare them!
-
-        if not self.qualifier and not other.qualifier:
-            return 0
-        elif self.qualifier and not other.qualifier:
-            return -1
-        elif not self.qualifier and other.qualifier:
-            return 1
-        elif self.qualifier and other.qualifier:
-            if self.qualifier < other.qualifier:
-                return -1
-            elif self.qualifier > other.qualifier:
-                return 1
-            else:
-                return 0
+        key = other._key if isinstance(other, StandardVersion) else self._other_key(other)
+        if key is None:
+            raise TypeError('Cannot compare %r with %r' % (self, other))
+        return (self._key > key) - (self._key < key)
 
     def __hash__(self):
-        return hash(self.tuple)
+        return self._hash
+
+
+# StandardVersion blocks __setattr__, so __init__ stores its slots directly.
+_set_key = StandardVersion._key.__set__
+_set_qualifier = StandardVersion._qualifier.__set__
+_set_hash = StandardVersion._hash.__set__
+
+
+# Range bounds are stored as cut keys: a version lies within a range when
+# lower <= version._key < upper.  A cut of key + (1,) falls between a version
+# and everything above it, which turns inclusive upper and exclusive lower
+# bounds into the same half-open comparison.
+_UNBOUNDED_LOWER = ()
+_UNBOUNDED_UPPER = (float('inf'),)
+
+
+def _lower_cut(version, include):
+    if version is None:
+        return _UNBOUNDED_LOWER
+    return version._key if include else version._key + (1,)
+
+
+def _upper_cut(version, include):
+    if version is None:
+        return _UNBOUNDED_UPPER
+    return version._key + (1,) if include else version._key
+
+
+def _key_of(version):
+    try:
+        return version._key
+    except AttributeError:
+        return StandardVersion.parse(version)._key
+
+
+# Versions with at least a minor number, optionally tagged with a leading 'v',
+# that are not embedded in a longer word or number.  Unlike _version_pattern
+# the qualifier must end in a letter or digit, so sentence punctuation after a
+# version is not taken for part of it.
+_scan_re = re.compile((r'(?<![\w.]) v? (?=\d+\.\d) ' + _numbers_pattern + r' (-(' + _qualifier_class + r'*[a-zA-Z0-9]))? (?![\w\-]|\.\d)').encode('ascii'), re.VERBOSE)
+
+
+def scan_versions(source):
+    """
+      Lazily yield every version found in a file or buffer.
+
+      Files are memory-mapped and buffers are scanned in place, so neither is
+      read into memory or decoded as a whole.  Only versions with at least a
+      major and minor number that stand apart from surrounding words and
+      numbers are reported, including tags such as ``v1.2.3``.
+
+      :param source: A file path, a file object with a `fileno`, or a
+        `bytes`, `bytearray` or `memoryview`.
+      :returns: A generator of (offset, `StandardVersion`) pairs where offset
+        is the byte offset of the version in the source, after any 'v'.
+    """
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for item in _scan_buffer(source):
+            yield item
+        return
+
+    fp = open(source, 'rb') if not hasattr(source, 'fileno') else None
+    try:
+        try:
+            buffer = mmap.mmap((fp or source).fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return
+        try:
+            for item in _scan_buffer(buffer):
+                yield item
+        finally:
+            buffer.close()
+    finally:
+        if fp is not None:
+            fp.close()
+
+
+def _scan_buffer(buffer):
+    for match in _scan_re.finditer(buffer):
+        (major, minor, patch, qualifier) = match.group(1, 3, 5, 7)
+        yield match.start(1), StandardVersion(int(major), int(minor), int(patch or 0), qualifier.decode('ascii') if qualifier else None)
+
+
+CatalogResult = collections.namedtuple('CatalogResult', 'rows invalid')
+
+
+def sort_catalog(rows, executor=None, chunksize=100000, unique=True, cls=StandardVersion):
+    """
+      Sort, and optionally deduplicate, (artifact, version string) pairs by
+      artifact and then by version.
+
+      Each chunk of rows is parsed and sorted as flat tuples of the artifact,
+      the fields of the version key and the original string, in the executor
+      if one is given, and the sorted runs are then merged lazily.
+      Only strings and tuples cross process boundaries, never version
+      objects, so a `ProcessPoolExecutor` spreads the parsing and sorting
+      over all cores.
+
+      Rows whose version does not parse are dropped and their index recorded.
+      Of equal versions spelt differently, such as '1.0' and '1.0.0', the
+      spelling that sorts first as a string is kept.
+
+      :param rows: An iterable of (artifact, version string) pairs.
+      :param executor: An optional `concurrent.futures.Executor` to sort
+        chunks of the input in.
+      :param chunksize: The number of rows handed to the executor at once.
+      :param unique: Drop rows whose artifact and version equal the previous.
+      :param cls: The version class whose ordering is used.
+      :returns: A `CatalogResult` of (rows, invalid) where rows is an
+        iterator of sorted (artifact, version string) pairs and invalid is an
+        `array` of row indices.
+    """
+
+    if executor is None:
+        runs, invalid = _sort_chunk(cls, rows, 0, unique)
+        runs = [runs]
+    else:
+        futures = []
+        chunk = []
+        offset = 0
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                futures.append(executor.submit(_sort_chunk, cls, chunk, offset, unique))
+                offset += chunksize
+                chunk = []
+        if chunk:
+            futures.append(executor.submit(_sort_chunk, cls, chunk, offset, unique))
+
+        runs = []
+        invalid = array('l')
+        for future in futures:
+            run, run_invalid = future.result()
+            runs.append(run)
+            invalid.extend(run_invalid)
+
+    merged = runs[0] if len(runs) == 1 else heapq.merge(*runs)
+    if unique and len(runs) > 1:
+        merged = _unique_rows(merged)
+    return CatalogResult(((row[0], row[-1]) for row in merged), invalid)
+
+
+def _sort_chunk(cls, rows, offset, unique):
+    match = cls._version_re.match
+    keyed = []
+    invalid = array('l')
+    append = keyed.append
+
+    for index, (artifact, version_string) in enumerate(rows, offset):
+        try:
+            m = match(version_string)
+        except TypeError:
+            m = None
+        if m is None:
+            invalid.append(index)
+            continue
+
+        (major, minor, patch, qualifier) = m.group(1, 3, 5, 7)
+        tokens = _qualifier_key(cls, qualifier) if qualifier else None
+        if tokens is None:
+            append((artifact, int(major), int(minor or 0), int(patch or 0), 1, (), version_string))
+        else:
+            append((artifact, int(major), int(minor or 0), int(patch or 0), 0, tokens, version_string))
+
+    keyed.sort()
+    if unique:
+        keyed = list(_unique_rows(keyed))
+    return keyed, invalid
+
+
+def _unique_rows(rows):
+    last = None
+    for row in rows:
+        key = row[:-1]
+        if key != last:
+            last = key
+            yield row
 
 
 class VersionRange(object):
-    _range_re = re.compile(r'^([\[\(])\s*(\d+) (\. (\d+) (\. (\d+))?)? (-([a-zA-Z0-9_\.\-]+))?\s*,\s*(\d+) (\. (\d+) (\. (\d+))?)? (-([a-zA-Z0-9_\.\-]+))?\s*([\]\)])$', re.VERBOSE)
+    """
+      Represents a range of versions.  Either bound may be None, which leaves
+      that end of the range unbounded.
+
+      Ranges are immutable and their bounds are converted into cut keys once,
+      so `contains` is two key comparisons.
+    """
+
+    __slots__ = ('_start', '_start_include', '_end', '_end_include', '_lower', '_upper', '_hash')
+
+    _cache = None
+
+    _range_re = re.compile(r'^([\[\(])\s*(?:' + _version_pattern + r')?\s*,\s*(?:' + _version_pattern + r')?\s*([\]\)])$', re.VERBOSE)
+    _exact_re = re.compile(r'^\[\s*' + _version_pattern + r'\s*\]$', re.VERBOSE)
+    _spec_item_re = re.compile(r'\s*([\[\(][^\[\]\(\)]*[\]\)])\s*(?:,(?=\s*[\[\(])|$)')
+    _range_bytes_re = re.compile(_range_re.pattern[1:-1].encode('ascii'), re.VERBOSE)
+    _exact_bytes_re = re.compile(_exact_re.pattern[1:-1].encode('ascii'), re.VERBOSE)
 
     def __init__(self, start, start_include, end, end_include):
-        self.start = start
-        self.start_include = start_include
-        self.end = end
-        self.end_include = end_include
+        start_include = bool(start_include) and start is not None
+        end_include = bool(end_include) and end is not None
+
+        _set_start(self, start)
+        _set_start_include(self, start_include)
+        _set_end(self, end)
+        _set_end_include(self, end_include)
+        _set_lower(self, _lower_cut(start, start_include))
+        _set_upper(self, _upper_cut(end, end_include))
+        _set_range_hash(self, hash((self._lower, self._upper)))
+
+    @classmethod
+    def enable_cache(cls, maxsize=1024, shards=16):
+        """
+          Cache the results of `parse` for this class only.  The bounds of
+          parsed ranges are interned when the `StandardVersion` cache is
+          enabled as well.
+
+          :param maxsize: The number of range strings to remember.
+          :param shards: The number of independently locked cache shards.
+        """
+
+        cls._cache = ShardedLRUCache(maxsize, shards)
+
+    @classmethod
+    def disable_cache(cls):
+        cls._cache = None
+
+    @classmethod
+    def cache_info(cls):
+        """
+          :returns: A `CacheInfo` for the parse cache or None if it is disabled.
+        """
+
+        cache = cls.__dict__.get('_cache')
+        return cache.info() if cache is not None else None
 
     @classmethod
     def parse(cls, range_string):
+        """
+          Parse a single range such as ``[1.0, 2.0)``, ``[1.0,)``, ``(,2.0]``
+          or the exact match ``[1.0]``.  Use `VersionSet.parse` for unions of
+          ranges.
+        """
+
+        cache = cls.__dict__.get('_cache')
+        if cache is None:
+            return cls._parse(range_string)
+
+        version_range = cache.get(range_string)
+        if version_range is None:
+            version_range = cls._parse(range_string)
+            cache.put(range_string, version_range)
+        return version_range
+
+    @classmethod
+    def _parse(cls, range_string):
         match = cls._range_re.match(range_string)
-        if not match:
-            raise ValueError("Invalid version range '%s'" % range_string)
+        if match:
+            start, start_major, start_minor, start_patch, start_qualifier, end_major, end_minor, end_patch, end_qualifier, end = match.group(1, 2, 4, 6, 8, 9, 11, 13, 15, 16)
 
-        start, start_major, start_minor, start_patch, start_qualifier, end_major, end_minor, end_patch, end_qualifier, end = match.group(1, 2, 4, 6, 8, 9, 11, 13, 15, 16)
+            start_version = cls._version(start_major, start_minor, start_patch, start_qualifier)
+            end_version = cls._version(end_major, end_minor, end_patch, end_qualifier)
+            return cls(start_version, start == '[', end_version, end == ']')
+
+        match = cls._exact_re.match(range_string)
+        if match:
+            version = cls._version(*match.group(1, 3, 5, 7))
+            return cls(version, True, version, True)
+
+        raise ValueError("Invalid version range '%s'" % range_string)
+
+    @classmethod
+    def parse_buffer(cls, buffer, offset=0, length=None):
+        """
+          Parse a range held in a `bytes`, `bytearray` or `memoryview`
+          without slicing or decoding the buffer.  The parse cache is not
+          consulted.
+
+          :param offset: The index of the first byte of the range.
+          :param length: The length of the range, by default up to the end
+            of the buffer.
+          :raises ValueError: if the field lies outside the buffer or is
+            invalid.
+        """
+
+        stop = _buffer_stop(buffer, offset, length)
+        match = cls._range_bytes_re.fullmatch(buffer, offset, stop)
+        if match:
+            start, start_major, start_minor, start_patch, start_qualifier, end_major, end_minor, end_patch, end_qualifier, end = match.group(1, 2, 4, 6, 8, 9, 11, 13, 15, 16)
+
+            start_version = cls._version_bytes(start_major, start_minor, start_patch, start_qualifier)
+            end_version = cls._version_bytes(end_major, end_minor, end_patch, end_qualifier)
+            return cls(start_version, start == b'[', end_version, end == b']')
+
+        match = cls._exact_bytes_re.fullmatch(buffer, offset, stop)
+        if match:
+            version = cls._version_bytes(*match.group(1, 3, 5, 7))
+            return cls(version, True, version, True)
+
+        raise ValueError("Invalid version range %r" % bytes(buffer[offset:stop]))
+
+    @classmethod
+    def _version_bytes(cls, major, minor, patch, qualifier):
+        return cls._version(major, minor, patch, qualifier.decode('ascii') if qualifier else None)
+
+    @staticmethod
+    def _version(major, minor, patch, qualifier):
+        if major is None:
+            return None
+        return StandardVersion._intern(StandardVersion(int(major), int(minor or 0), int(patch or 0), qualifier))
+
+    @classmethod
+    def parse_all(cls, spec):
+        """
+          Parse a comma separated list of ranges, such as
+          ``[1.0,2.0),[3.0,)``.
 
-        start_version = StandardVersion(int(start_major or 0), int(start_minor or 0), int(start_patch or 0), start_qualifier)
-        end_version = StandardVersion(int(end_major or 0), int(end_minor or 0), int(end_patch or 0), end_qualifier)
-        return cls(start_version, start == '[', end_version, end == ']')
+          :returns: A `list` of `VersionRange`s.
+        """
+
+        ranges = []
+        pos = 0
+        while pos < len(spec) or not ranges:
+            match = cls._spec_item_re.match(spec, pos)
+            if not match or match.end() == pos:
+                raise ValueError("Invalid version range '%s'" % spec)
+            ranges.append(cls.parse(match.group(1)))
+            pos = match.end()
+        return ranges
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def start_include(self):
+        return self._start_include
+
+    @property
+    def end(self):
+        return self._end
+
+    @property
+    def end_include(self):
+        return self._end_include
 
     def contains(self, version):
-        if self.start:
-            if version < self.start:
-                return False
-            if not self.start_include and version == self.start:
-                return False
-        if self.end:
-            if version > self.end:
-                return False
-            if not self.end_include and version == self.end:
-                return False
-        return True
+        return self._lower <= _key_of(version) < self._upper
+
+    def matcher(self):
+        """ Return a `RangeMatcher` for this range. """
+
+        return RangeMatcher([(self._lower, self._upper)])
 
     @property
     def tuple(self):
-        return self.start.tuple, self.start_include, self.end.tuple, self.end_include
+        start = self._start.tuple if self._start is not None else None
+        end = self._end.tuple if self._end is not None else None
+        return start, self._start_include, end, self._end_include
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __reduce__(self):
+        return self.__class__, (self._start, self._start_include, self._end, self._end_include)
 
     def __str__(self):
         string = '[' if self.start_include else '('
@@ -189,10 +1152,836 @@ class VersionRange(object):
         return 'VersionRange(%r, %r, %r, %r)' % (self.start, self.start_include, self.end, self.end_include)
 
     def __eq__(self, other):
-        return self.tuple == other.tuple
+        if not isinstance(other, VersionRange):
+            return NotImplemented
+        return self._lower == other._lower and self._upper == other._upper
+
+    def __ne__(self, other):
+        if not isinstance(other, VersionRange):
+            return NotImplemented
+        return self._lower != other._lower or self._upper != other._upper
+
+    def __hash__(self):
+        return self._hash
+
+
+_set_start = VersionRange._start.__set__
+_set_start_include = VersionRange._start_include.__set__
+_set_end = VersionRange._end.__set__
+_set_end_include = VersionRange._end_include.__set__
+_set_lower = VersionRange._lower.__set__
+_set_upper = VersionRange._upper.__set__
+_set_range_hash = VersionRange._hash.__set__
+
+
+class RangeMatcher(object):
+    """
+      A compiled test for membership in one or more version ranges.
+
+      The ranges are reduced to sorted, disjoint pairs of cut keys.  A single
+      range is checked with two key comparisons, a union of ranges with one
+      binary search.
+    """
+
+    __slots__ = ('_lowers', '_uppers', '_lower', '_upper')
+
+    def __init__(self, cuts):
+        self._lowers = [cut[0] for cut in cuts]
+        self._uppers = [cut[1] for cut in cuts]
+        if len(cuts) == 1:
+            self._lower, self._upper = cuts[0]
+        else:
+            self._lower = self._upper = None
+
+    def matches(self, version):
+        key = _key_of(version)
+        if self._lower is not None:
+            return self._lower <= key < self._upper
+        i = bisect_right(self._lowers, key) - 1
+        return i >= 0 and key < self._uppers[i]
+
+    __call__ = matches
+
+    def filter(self, versions):
+        """ Return the list of `versions` matched by this matcher. """
+
+        if self._lower is not None:
+            lower = self._lower
+            upper = self._upper
+            return [version for version in versions if lower <= _key_of(version) < upper]
+        return [version for version in versions if self.matches(version)]
+
+
+_matcher_cache = ShardedLRUCache(1024)
+
+
+def compile_range(spec):
+    """
+      Compile a range spec, such as ``[1.0,2.0),[3.0,)``, into a
+      `RangeMatcher`.  Compiled matchers are cached by spec.
+    """
+
+    matcher = _matcher_cache.get(spec)
+    if matcher is None:
+        matcher = VersionSet.parse(spec).matcher()
+        _matcher_cache.put(spec, matcher)
+    return matcher
+
+
+class VersionIndex(object):
+    """
+      A sorted set of versions.
+
+      Versions are kept ordered by their sort key so that range, floor and
+      ceiling queries are binary searches.  Equal versions, such as ``1.0``
+      and ``1.0.0``, are stored once.
+    """
+
+    def __init__(self, versions=()):
+        self._versions = sorted(set(versions))
+        self._keys = [version._key for version in self._versions]
+
+    def add(self, version):
+        """
+          Add a version to the index.
+
+          :returns: False if an equal version was already present.
+        """
+
+        key = version._key
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return False
+        self._keys.insert(i, key)
+        self._versions.insert(i, version)
+        return True
+
+    def discard(self, version):
+        """
+          Remove a version from the index if it is present.
+
+          :returns: True if a version was removed.
+        """
+
+        key = version._key
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+            del self._versions[i]
+            return True
+        return False
+
+    def remove(self, version):
+        if not self.discard(version):
+            raise KeyError(version)
+
+    def floor(self, version):
+        """ Return the greatest version less than or equal to `version`, or None. """
+
+        i = bisect_right(self._keys, version._key)
+        return self._versions[i - 1] if i else None
+
+    def ceiling(self, version):
+        """ Return the least version greater than or equal to `version`, or None. """
+
+        i = bisect_left(self._keys, version._key)
+        return self._versions[i] if i < len(self._versions) else None
+
+    def lower(self, version):
+        """ Return the greatest version strictly less than `version`, or None. """
+
+        i = bisect_left(self._keys, version._key)
+        return self._versions[i - 1] if i else None
+
+    def higher(self, version):
+        """ Return the least version strictly greater than `version`, or None. """
+
+        i = bisect_right(self._keys, version._key)
+        return self._versions[i] if i < len(self._versions) else None
+
+    def nearest(self, version):
+        """
+          Return the version closest to `version`, or None if the index is
+          empty.
+
+          Neighbours are compared by the distance between their major, minor
+          and patch numbers, in that order; ties go to the lower version.
+        """
+
+        i = bisect_left(self._keys, version._key)
+        if i < len(self._keys) and self._keys[i] == version._key:
+            return self._versions[i]
+
+        below = self._versions[i - 1] if i else None
+        above = self._versions[i] if i < len(self._versions) else None
+        if below is None or above is None:
+            return below or above
+
+        target = version.version
+        below_distance = tuple(abs(a - b) for a, b in zip(target, below.version))
+        above_distance = tuple(abs(a - b) for a, b in zip(target, above.version))
+        return above if above_distance < below_distance else below
+
+    def _span(self, version_range):
+        lo = bisect_left(self._keys, version_range._lower)
+        hi = bisect_left(self._keys, version_range._upper, lo)
+        return lo, hi
+
+    def range(self, version_range):
+        """ Return the sorted list of versions contained in `version_range`. """
+
+        lo, hi = self._span(version_range)
+        return self._versions[lo:hi]
+
+    def count(self, version_range):
+        """ Return the number of versions contained in `version_range`. """
+
+        lo, hi = self._span(version_range)
+        return hi - lo
+
+    def latest(self, version_range=None):
+        """
+          Return the highest version, optionally restricted to those contained
+          in `version_range`, or None if there is no such version.
+        """
+
+        if version_range is None:
+            return self._versions[-1] if self._versions else None
+
+        lo, hi = self._span(version_range)
+        return self._versions[hi - 1] if hi > lo else None
+
+    def __contains__(self, version):
+        key = version._key
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def __getitem__(self, index):
+        return self._versions[index]
+
+    def __iter__(self):
+        return iter(self._versions)
+
+    def __reversed__(self):
+        return reversed(self._versions)
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __repr__(self):
+        return 'VersionIndex(%r)' % (self._versions,)
+
+
+def _build_interval_tree(items):
+    if not items:
+        return None
+
+    lowers = sorted(item[0] for item in items)
+    center = lowers[len(lowers) // 2]
+
+    left = []
+    right = []
+    here = []
+    for item in items:
+        if item[1] <= center:
+            left.append(item)
+        elif item[0] > center:
+            right.append(item)
+        else:
+            here.append(item)
+
+    by_lower = sorted(here, key=lambda item: item[0])
+    by_upper = sorted(here, key=lambda item: item[1])
+    return (center,
+            [item[0] for item in by_lower], [item[2] for item in by_lower],
+            [item[1] for item in by_upper], [item[2] for item in by_upper],
+            _build_interval_tree(left), _build_interval_tree(right))
+
+
+class VersionRangeIndex(object):
+    """
+      A collection of version ranges answering which of them contain a given
+      version.
+
+      The ranges are kept in a centered interval tree that is rebuilt lazily
+      after the collection changes, so a lookup costs O(log n + k) for k
+      matching ranges.  Matching ranges are returned in no particular order.
+    """
+
+    def __init__(self, version_ranges=()):
+        self._ranges = list(version_ranges)
+        self._tree = None
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def add(self, version_range):
+        with self._lock:
+            self._ranges.append(version_range)
+            self._dirty = True
+
+    def remove(self, version_range):
+        with self._lock:
+            self._ranges.remove(version_range)
+            self._dirty = True
+
+    def _root(self):
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._tree = _build_interval_tree([(r._lower, r._upper, r) for r in self._ranges if r._lower < r._upper])
+                    self._dirty = False
+        return self._tree
+
+    def find(self, version):
+        """ Return the list of ranges that contain `version`. """
+
+        key = _key_of(version)
+        node = self._root()
+        found = []
+        while node is not None:
+            center, lowers, lower_ranges, uppers, upper_ranges, left, right = node
+            if key < center:
+                found.extend(lower_ranges[:bisect_right(lowers, key)])
+                node = left
+            elif key > center:
+                found.extend(upper_ranges[bisect_right(uppers, key):])
+                node = right
+            else:
+                found.extend(lower_ranges)
+                break
+        return found
+
+    def find_many(self, versions):
+        """
+          Return, for each of `versions`, the list of ranges that contain it.
+
+          The versions are swept in sorted order against the ranges sorted by
+          their lower bounds, which is cheaper than one lookup per version
+          for large batches.
+        """
+
+        keys = [_key_of(version) for version in versions]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        with self._lock:
+            ranges = list(self._ranges)
+        items = sorted(((r._lower, r._upper, r) for r in ranges), key=lambda item: item[0])
+
+        found = [None] * len(keys)
+        active = []
+        next_item = 0
+        for i in order:
+            key = keys[i]
+            while next_item < len(items) and items[next_item][0] <= key:
+                lower, upper, version_range = items[next_item]
+                heapq.heappush(active, (upper, next_item, version_range))
+                next_item += 1
+            while active and active[0][0] <= key:
+                heapq.heappop(active)
+            found[i] = [entry[2] for entry in active]
+        return found
+
+    def __iter__(self):
+        return iter(self._ranges)
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __repr__(self):
+        return 'VersionRangeIndex(%r)' % (self._ranges,)
+
+
+def _normalize(intervals):
+    intervals = sorted((i for i in intervals if i[0] < i[1]), key=lambda i: i[0])
+    merged = []
+    for interval in intervals:
+        if merged:
+            lower, upper, start, end = merged[-1]
+            if interval[0] <= upper:
+                if interval[1] > upper:
+                    merged[-1] = (lower, interval[1], start, interval[3])
+                continue
+        merged.append(interval)
+    return merged
+
+
+class VersionSet(object):
+    """
+      A set of versions described by any number of version ranges.
+
+      The ranges are merged into a canonical sorted list of disjoint
+      intervals, so a membership test is one binary search no matter how many
+      ranges were combined.  Sets are immutable; the algebra methods return
+      new sets.
+    """
+
+    def __init__(self, version_ranges=()):
+        self._set_intervals(_normalize((r._lower, r._upper, r.start, r.end) for r in version_ranges))
+
+    def _set_intervals(self, intervals):
+        self._intervals = intervals
+        self._lowers = [interval[0] for interval in intervals]
+
+    @classmethod
+    def _from_intervals(cls, intervals):
+        version_set = cls.__new__(cls)
+        version_set._set_intervals(intervals)
+        return version_set
+
+    @classmethod
+    def parse(cls, spec):
+        """ Parse a comma separated list of ranges, such as ``[1.0,2.0),[3.0,)``. """
+
+        return cls(VersionRange.parse_all(spec))
+
+    @classmethod
+    def all(cls):
+        """ Return the set of all versions. """
+
+        return cls._from_intervals([(_UNBOUNDED_LOWER, _UNBOUNDED_UPPER, None, None)])
+
+    def contains(self, version):
+        key = _key_of(version)
+        i = bisect_right(self._lowers, key) - 1
+        return i >= 0 and key < self._intervals[i][1]
+
+    def matcher(self):
+        """ Return a `RangeMatcher` for this set. """
+
+        return RangeMatcher([(interval[0], interval[1]) for interval in self._intervals])
+
+    def ranges(self):
+        """ Return the disjoint intervals of this set as sorted `VersionRange`s. """
+
+        return [VersionRange(start, start is not None and lower == start._key, end, end is not None and upper != end._key)
+                for lower, upper, start, end in self._intervals]
+
+    def is_empty(self):
+        return not self._intervals
+
+    def union(self, *others):
+        intervals = list(self._intervals)
+        for other in others:
+            intervals.extend(other._intervals)
+        return self._from_intervals(_normalize(intervals))
+
+    def intersection(self, other):
+        intervals = []
+        mine = self._intervals
+        theirs = other._intervals
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            a = mine[i]
+            b = theirs[j]
+            lower, start = (a[0], a[2]) if a[0] >= b[0] else (b[0], b[2])
+            if a[1] <= b[1]:
+                upper, end = a[1], a[3]
+                i += 1
+            else:
+                upper, end = b[1], b[3]
+                j += 1
+            if lower < upper:
+                intervals.append((lower, upper, start, end))
+        return self._from_intervals(intervals)
+
+    def complement(self):
+        intervals = []
+        lower, start = _UNBOUNDED_LOWER, None
+        for interval in self._intervals:
+            if interval[0] != _UNBOUNDED_LOWER:
+                intervals.append((lower, interval[0], start, interval[2]))
+            lower, start = interval[1], interval[3]
+        if lower != _UNBOUNDED_UPPER:
+            intervals.append((lower, _UNBOUNDED_UPPER, start, None))
+        return self._from_intervals(intervals)
+
+    def difference(self, other):
+        return self.intersection(other.complement())
+
+    def issubset(self, other):
+        return self.difference(other).is_empty()
+
+    def issuperset(self, other):
+        return other.issubset(self)
+
+    def isdisjoint(self, other):
+        return self.intersection(other).is_empty()
+
+    def _bounds(self):
+        return [(interval[0], interval[1]) for interval in self._intervals]
+
+    __contains__ = contains
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __invert__ = complement
+    __le__ = issubset
+    __ge__ = issuperset
+
+    def __bool__(self):
+        return bool(self._intervals)
+
+    def __eq__(self, other):
+        if not isinstance(other, VersionSet):
+            return NotImplemented
+        return self._bounds() == other._bounds()
 
     def __ne__(self, other):
-        return not self.__eq__(other)
+        if not isinstance(other, VersionSet):
+            return NotImplemented
+        return self._bounds() != other._bounds()
 
     def __hash__(self):
-        return hash(self.tuple)
+        return hash(tuple(self._bounds()))
+
+    def __str__(self):
+        return ','.join(str(version_range) for version_range in self.ranges())
+
+    def __repr__(self):
+        return 'VersionSet(%r)' % (self.ranges(),)
+
+
+def compile_requirement(expected):
+    """
+      Compile a requirement into a `RangeMatcher`.
+
+      :param expected: A `str` minimum version such as ``1.2``, a `str` range
+        spec such as ``[1.2,2.0),[3.0,)``, a `StandardVersion` minimum, or a
+        `VersionRange` or `VersionSet`.
+    """
+
+    if isinstance(expected, str):
+        if expected.lstrip().startswith(('[', '(')):
+            return compile_range(expected)
+        expected = StandardVersion.parse(expected)
+    if isinstance(expected, StandardVersion):
+        return VersionRange(expected, True, None, False).matcher()
+    return expected.matcher()
+
+
+RequirementFailure = collections.namedtuple('RequirementFailure', 'package given expected reason')
+
+
+class RequirementSet(object):
+    """
+      A set of version requirements, parsed once and checked in bulk.
+
+      Each requirement maps a package name to either a minimum version, such
+      as ``1.2``, or a range spec, such as ``[1.2,2.0),[3.0,)``.  The outcome
+      of checking a package against a given version is memoized, so repeated
+      checks of an unchanged environment are dictionary lookups.
+
+      :param requirements: A mapping, or iterable of pairs, of package name to
+        a `str` spec, `StandardVersion`, `VersionRange` or `VersionSet`.
+      :param maxsize: The number of check outcomes to remember.
+    """
+
+    MISSING = 'missing'
+    INVALID = 'invalid'
+    UNSATISFIED = 'unsatisfied'
+
+    def __init__(self, requirements, maxsize=4096):
+        if hasattr(requirements, 'items'):
+            requirements = requirements.items()
+
+        self._requirements = collections.OrderedDict()
+        for package, expected in requirements:
+            self._requirements[package] = (str(expected), compile_requirement(expected))
+        self._outcomes = LRUCache(maxsize)
+
+    def _check_one(self, package, given):
+        outcome = self._outcomes.get((package, given), self)
+        if outcome is not self:
+            return outcome
+
+        expected, matcher = self._requirements[package]
+        if given is None:
+            outcome = RequirementFailure(package, None, expected, self.MISSING)
+        else:
+            try:
+                outcome = None if matcher(given) else RequirementFailure(package, given, expected, self.UNSATISFIED)
+            except ValueError:
+                outcome = RequirementFailure(package, given, expected, self.INVALID)
+
+        self._outcomes.put((package, given), outcome)
+        return outcome
+
+    def check(self, installed):
+        """
+          Check every requirement against a mapping of installed versions.
+
+          :param installed: A mapping of package name to a `str` version or
+            `StandardVersion`; absent packages are reported as missing.
+          :returns: A `list` of `RequirementFailure`s, empty when every
+            requirement is satisfied.
+        """
+
+        failures = []
+        for package in self._requirements:
+            failure = self._check_one(package, installed.get(package))
+            if failure is not None:
+                failures.append(failure)
+        return failures
+
+    def check_installed(self):
+        """
+          Check every requirement against the installed distributions.  A
+          package installed with a version that is not a standard one is
+          reported as invalid rather than missing.
+        """
+
+        installed = versions_for_packages(self._requirements)
+        for package, version in installed.items():
+            if version is None:
+                try:
+                    installed[package] = version_for_package(package)
+                except LookupError:
+                    pass
+        return self.check(installed)
+
+    def __contains__(self, package):
+        return package in self._requirements
+
+    def __iter__(self):
+        return iter(self._requirements)
+
+    def __len__(self):
+        return len(self._requirements)
+
+    def __repr__(self):
+        return 'RequirementSet(%r)' % (dict((package, expected) for package, (expected, matcher) in self._requirements.items()),)
+
+
+_numpy = []
+
+
+def _load_numpy():
+    """ Import NumPy on first use, so that it does not slow down importing this module. """
+
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+class VersionArray(object):
+    """
+      An immutable column of versions stored as packed unsigned 64-bit keys.
+
+      The keys use the layout of the 8 byte prefix of `StandardVersion.to_key`
+      read as an integer, except that the qualifier rank indexes a sorted
+      table of the qualifiers present in the array, so no tail is needed.  Keys are held in a NumPy array
+      when NumPy is installed and in an `array` otherwise; comparisons and
+      range tests return boolean masks, as a NumPy array or a `list`.
+
+      :param versions: An iterable of `StandardVersion`s or `str` versions.
+      :param use_numpy: Force the NumPy backend on or off; by default it is
+        used when available.
+      :raises OverflowError: if a major, minor or patch number of a stored
+        version exceeds 65535.  Versions compared with, searched for or
+        bounding a range may be of any size.
+    """
+
+    def __init__(self, versions=(), use_numpy=None):
+        versions = [v if isinstance(v, StandardVersion) else StandardVersion.parse(v) for v in versions]
+
+        spellings = {}
+        for version in versions:
+            if not version._key[3]:
+                spellings.setdefault(version._key[4], version._qualifier)
+        qualifiers = sorted(spellings)
+        if 2 * len(qualifiers) + 1 >= _PACKED_NO_QUALIFIER:
+            raise OverflowError('Too many distinct qualifiers for a VersionArray')
+
+        np = _load_numpy() if use_numpy is not False else None
+        if use_numpy and np is None:
+            raise ImportError('NumPy is not installed')
+
+        self._np = np
+        self._qualifiers = qualifiers
+        self._spellings = [spellings[tokens] for tokens in qualifiers]
+        keys = [self._encode(version) for version in versions]
+        self._keys = np.array(keys, dtype=np.uint64) if np is not None else array('Q', keys)
+
+    def _derive(self, keys):
+        derived = self.__class__.__new__(self.__class__)
+        derived._np = self._np
+        derived._qualifiers = self._qualifiers
+        derived._spellings = self._spellings
+        derived._keys = keys
+        return derived
+
+    def _encode(self, version):
+        major, minor, patch, release, tokens = _key_of(version)
+        if major > _PACKED_FIELD_MAX or minor > _PACKED_FIELD_MAX or patch > _PACKED_FIELD_MAX:
+            raise OverflowError("Version '%s' cannot be packed into a key" % version)
+        if release:
+            rank = _PACKED_NO_QUALIFIER
+        else:
+            i = bisect_left(self._qualifiers, tokens)
+            found = i < len(self._qualifiers) and self._qualifiers[i] == tokens
+            rank = 2 * i + 1 if found else 2 * i
+        return (major << 48) | (minor << 32) | (patch << 16) | rank
+
+    def _query_key(self, version):
+        """
+          Return the key of a version to compare with.  A version with numbers
+          beyond the packed fields maps to a key between the stored keys,
+          which may be as large as 1 << 64; rank 0 is never stored.
+        """
+
+        major, minor, patch, release, tokens = _key_of(version)
+        if major > _PACKED_FIELD_MAX:
+            return 1 << 64
+        if minor > _PACKED_FIELD_MAX:
+            return (major + 1) << 48
+        if patch > _PACKED_FIELD_MAX:
+            return ((major << 16 | minor) + 1) << 32
+        return self._encode(version)
+
+    def _decode(self, key):
+        key = int(key)
+        rank = key & 0xFFFF
+        qualifier = None if rank == _PACKED_NO_QUALIFIER else self._spellings[rank >> 1]
+        return StandardVersion(key >> 48, (key >> 32) & 0xFFFF, (key >> 16) & 0xFFFF, qualifier)
+
+    def _mask(self, test):
+        if self._np is not None:
+            return test(self._keys)
+        return [test(key) for key in self._keys]
+
+    def _cuts(self, version_range):
+        lower = None if version_range.start is None else self._query_key(version_range.start) + (0 if version_range.start_include else 1)
+        upper = None if version_range.end is None else self._query_key(version_range.end) + (1 if version_range.end_include else 0)
+        if upper is not None and upper >> 64:
+            upper = None
+        return lower, upper
+
+    def within(self, versions):
+        """
+          Return a mask of the elements contained in a `VersionRange` or
+          `VersionSet`.
+        """
+
+        ranges = versions.ranges() if isinstance(versions, VersionSet) else [versions]
+        mask = None
+        for version_range in ranges:
+            lower, upper = self._cuts(version_range)
+            if lower is not None and lower >> 64:
+                # starts above every storable version
+                continue
+            if self._np is not None:
+                selected = self._np.ones(len(self._keys), dtype=bool)
+                if lower is not None:
+                    selected &= self._keys >= self._np.uint64(lower)
+                if upper is not None:
+                    selected &= self._keys < self._np.uint64(upper)
+                mask = selected if mask is None else mask | selected
+            else:
+                lower = 0 if lower is None else lower
+                upper = 1 << 64 if upper is None else upper
+                selected = [lower <= key < upper for key in self._keys]
+                mask = selected if mask is None else [a or b for a, b in zip(mask, selected)]
+
+        if mask is None:
+            mask = self._np.zeros(len(self._keys), dtype=bool) if self._np is not None else [False] * len(self._keys)
+        return mask
+
+    def argsort(self):
+        """ Return the indices that would sort the array. """
+
+        if self._np is not None:
+            return self._np.argsort(self._keys, kind='stable')
+        keys = self._keys
+        return array('l', sorted(range(len(keys)), key=keys.__getitem__))
+
+    def sort(self):
+        """ Return a sorted copy of the array. """
+
+        if self._np is not None:
+            return self._derive(self._np.sort(self._keys))
+        return self._derive(array('Q', sorted(self._keys)))
+
+    def unique(self):
+        """ Return a sorted copy of the array without duplicate versions. """
+
+        if self._np is not None:
+            return self._derive(self._np.unique(self._keys))
+        return self._derive(array('Q', sorted(set(self._keys))))
+
+    def searchsorted(self, version, side='left'):
+        """
+          Return the index at which `version` would be inserted to keep a
+          sorted array sorted.
+
+          :param side: 'left' for the first suitable index, 'right' for the last.
+        """
+
+        key = self._query_key(version)
+        if key >> 64:
+            return len(self._keys)
+        if self._np is not None:
+            return int(self._np.searchsorted(self._keys, self._np.uint64(key), side=side))
+        return bisect_left(self._keys, key) if side == 'left' else bisect_right(self._keys, key)
+
+    def to_list(self):
+        return [self._decode(key) for key in self._keys]
+
+    def _compare(self, other, test):
+        key = self._query_key(other)
+        if key >> 64:
+            # above every stored key, so every element compares alike
+            constant = test(0, 1)
+            if self._np is not None:
+                return self._np.full(len(self._keys), constant, dtype=bool)
+            return [constant] * len(self._keys)
+        if self._np is not None:
+            key = self._np.uint64(key)
+        return self._mask(lambda keys: test(keys, key))
+
+    def __lt__(self, other):
+        return self._compare(other, lambda keys, key: keys < key)
+
+    def __le__(self, other):
+        return self._compare(other, lambda keys, key: keys <= key)
+
+    def __gt__(self, other):
+        return self._compare(other, lambda keys, key: keys > key)
+
+    def __ge__(self, other):
+        return self._compare(other, lambda keys, key: keys >= key)
+
+    def __eq__(self, other):
+        return self._compare(other, lambda keys, key: keys == key)
+
+    def __ne__(self, other):
+        return self._compare(other, lambda keys, key: keys != key)
+
+    __hash__ = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._derive(self._keys[index])
+        try:
+            return self._decode(self._keys[operator.index(index)])
+        except TypeError:
+            pass
+
+        if self._np is not None:
+            return self._derive(self._keys[self._np.asarray(index)])
+        index = list(index)
+        if index and isinstance(index[0], bool):
+            return self._derive(array('Q', [key for key, keep in zip(self._keys, index) if keep]))
+        return self._derive(array('Q', [self._keys[i] for i in index]))
+
+    def __iter__(self):
+        for key in self._keys:
+            yield self._decode(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return 'VersionArray(%r)' % (self.to_list(),)
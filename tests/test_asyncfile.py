@@ -0,0 +1,80 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import asyncio
+import os
+import shutil
+import threading
+import time
+
+from livetribe.utils.asyncfile import async_temp_directory, AsyncTempDirectories
+
+
+def test_async_temp_directory():
+    async def use():
+        async with async_temp_directory(prefix='async') as tmpdir:
+            assert os.path.isdir(tmpdir)
+            assert os.path.basename(tmpdir).startswith('async')
+            with open(os.path.join(tmpdir, 't.txt'), 'w') as fp:
+                fp.write('zzz')
+        return tmpdir
+
+    tmpdir = asyncio.run(use())
+    assert not os.path.exists(tmpdir)
+
+
+def test_async_temp_directory_cleanups():
+    lock = threading.Lock()
+    running = [0, 0]
+    timings = []
+
+    def cleanup(path):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        shutil.rmtree(path)
+        with lock:
+            running[0] -= 1
+
+    directories = AsyncTempDirectories(max_cleanups=2, cleanup=cleanup, on_cleanup=lambda path, seconds: timings.append((path, seconds)))
+
+    async def use():
+        async with directories.temp_directory() as tmpdir:
+            await asyncio.sleep(0)
+        return tmpdir
+
+    async def ticker():
+        ticks = 0
+        while len(timings) < 6:
+            ticks += 1
+            await asyncio.sleep(0.001)
+        return ticks
+
+    async def main():
+        return await asyncio.gather(ticker(), *[use() for _ in range(6)])
+
+    try:
+        results = asyncio.run(main())
+    finally:
+        directories.shutdown()
+
+    ticks, paths = results[0], results[1:]
+    assert ticks > 10, 'The event loop should keep running during cleanups'
+    assert running[1] == 2
+    assert sorted(path for path, _ in timings) == sorted(paths)
+    assert all(seconds >= 0.05 for _, seconds in timings)
+    assert not any(os.path.exists(path) for path in paths)
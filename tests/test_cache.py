@@ -0,0 +1,117 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import gc
+import threading
+
+from livetribe.utils.cache import InternPool, LRUCache, ShardedLRUCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert 'b' not in cache, 'Least recently used entry should have been evicted'
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get('b') is None
+
+    info = cache.info()
+    assert info.hits == 3
+    assert info.misses == 1
+    assert info.evictions == 1
+    assert info.maxsize == 2
+    assert info.currsize == 2
+
+
+def test_lru_clear():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.info() == (0, 0, 0, 2, 0)
+
+
+def test_lru_threads():
+    cache = LRUCache(64)
+
+    def worker(offset):
+        for i in range(1000):
+            key = (offset + i) % 128
+            if cache.get(key) is None:
+                cache.put(key, key)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    info = cache.info()
+    assert info.hits + info.misses == 8000
+    assert info.currsize == 64
+
+
+def test_sharded_lru_cache():
+    cache = ShardedLRUCache(64, shards=4)
+
+    def worker(offset):
+        for i in range(1000):
+            key = (offset + i) % 128
+            if cache.get(key) is None:
+                cache.put(key, key)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    info = cache.info()
+    assert info.hits + info.misses == 8000
+    assert info.maxsize == 64
+    assert info.currsize == len(cache) <= 64
+
+    cache.put('key', 'value')
+    assert 'key' in cache
+    assert cache.get('key') == 'value'
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.info().hits == 0
+
+
+def test_intern_pool():
+    class Box(object):
+        def __init__(self, value):
+            self.value = value
+
+    pool = InternPool(lambda box: box.value)
+    first = pool.intern(Box(1))
+
+    assert pool.intern(Box(1)) is first
+    assert pool.intern(Box(2)) is not first
+    assert len(pool) == 1, 'Unreferenced objects should drop out of the pool'
+
+    del first
+    gc.collect()
+    assert len(pool) == 0
@@ -14,9 +14,14 @@
 # specific language governing permissions and limitations
 # under the License.
 #
+import gc
 import os
+import stat
+import tempfile
+import threading
+import weakref
 
-from livetribe.utils.file import temp_directory
+from livetribe.utils.file import clone_tree, flush_reaper, parallel_rmtree, reap, Reaper, temp_directory, TempDirectoryPool
 
 
 def test_temp_directory():
@@ -32,3 +37,276 @@ def test_temp_directory():
 
     assert not os.path.exists(test_file)
     assert not os.path.exists(tmpdir)
+
+
+def test_temp_directory_reap():
+    with temp_directory() as parent:
+        with temp_directory(dir=parent, cleanup=reap) as tmpdir:
+            with open(os.path.join(tmpdir, 't.txt'), 'w') as fp:
+                fp.write('zzz')
+
+        assert not os.path.exists(tmpdir)
+
+        flush_reaper()
+        assert os.listdir(parent) == []
+
+
+def test_reaper_backpressure():
+    started = threading.Event()
+    release = threading.Event()
+    removed = []
+
+    def remove(path):
+        started.set()
+        release.wait()
+        removed.append(path)
+        os.rmdir(path)
+
+    reaper = Reaper(maxsize=1, remove=remove)
+    with temp_directory() as parent:
+        paths = [os.path.join(parent, str(i)) for i in range(3)]
+        for path in paths:
+            os.mkdir(path)
+
+        reaper.reap(paths[0])
+        started.wait()
+        reaper.reap(paths[1])
+        blocked = threading.Thread(target=reaper.reap, args=(paths[2],))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive(), 'reap should block while the queue is full'
+
+        release.set()
+        blocked.join()
+        reaper.flush()
+
+        assert len(removed) == 3
+        assert os.listdir(parent) == []
+
+
+def test_reaper_failures():
+    errors = []
+
+    def remove(path):
+        raise OSError(13, 'Permission denied', path)
+
+    reaper = Reaper(remove=remove, onerror=lambda path, exc_info: errors.append((path, exc_info[0])))
+    with temp_directory() as parent:
+        path = os.path.join(parent, 'r')
+        os.mkdir(path)
+
+        reaper.reap(path)
+        reaper.flush()
+
+        trash = os.path.join(parent, os.listdir(parent)[0])
+        assert not os.path.exists(path)
+        assert os.path.basename(trash).startswith('.trash-')
+        assert errors == [(trash, PermissionError)]
+        assert [failed for failed, _ in reaper.failures] == [trash]
+        assert isinstance(reaper.failures[0][1][1], OSError)
+
+        for i in range(300):
+            path = os.path.join(parent, 'f%d' % i)
+            os.mkdir(path)
+            reaper.reap(path)
+        reaper.flush()
+        assert len(reaper.failures) == 256
+
+
+def test_reaper_collected():
+    reaper = Reaper()
+    with temp_directory() as parent:
+        path = os.path.join(parent, 'r')
+        os.mkdir(path)
+        reaper.reap(path)
+        reaper.flush()
+        assert os.listdir(parent) == []
+
+    thread = reaper._thread
+    collected = weakref.ref(reaper)
+    del reaper
+    gc.collect()
+
+    assert collected() is None, 'A started reaper should not be kept alive'
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_temp_directory_pool():
+    with temp_directory() as parent:
+        with TempDirectoryPool(maxsize=2, prefill=1, dir=parent) as pool:
+            assert len(pool) == 1
+
+            with pool.temp_directory() as first:
+                os.mkdir(os.path.join(first, 'sub'))
+                with open(os.path.join(first, 'sub', 't.txt'), 'w') as fp:
+                    fp.write('zzz')
+                os.symlink(parent, os.path.join(first, 'link'))
+
+                with pool.temp_directory() as second:
+                    with pool.temp_directory() as third:
+                        assert len(set([first, second, third])) == 3
+                        assert len(pool) == 0
+
+            assert os.path.isdir(first)
+            assert os.listdir(first) == []
+            assert os.path.isdir(parent), 'Scrubbing must not follow symlinks'
+            assert len(pool) == 2
+            assert not os.path.exists(third), 'The least recently released directory should be evicted'
+
+            with pool.temp_directory() as reused:
+                assert reused == first
+
+            with pool.temp_directory(prefix='tmp', dir=parent) as pooled:
+                assert pooled == first
+
+            with pool.temp_directory('.d', prefix='other') as fresh:
+                assert os.path.dirname(fresh) == tempfile.gettempdir()
+                assert os.path.basename(fresh).startswith('other')
+                assert fresh.endswith('.d')
+            assert not os.path.exists(fresh), 'Directories outside the pool should be removed'
+            assert len(pool) == 2
+
+        assert os.listdir(parent) == []
+
+
+def test_temp_directory_pool_close():
+    with temp_directory() as parent:
+        pool = TempDirectoryPool(dir=parent)
+        with pool.temp_directory() as tmpdir:
+            with open(os.path.join(tmpdir, 't.txt'), 'w') as fp:
+                fp.write('zzz')
+            pool.close()
+
+        assert not os.path.exists(tmpdir), 'Directories released after close should be removed'
+        assert len(pool) == 0
+        assert os.listdir(parent) == []
+
+
+def test_temp_directory_pool_ram():
+    with TempDirectoryPool(ram=True) as pool:
+        with pool.temp_directory() as tmpdir:
+            assert os.path.isdir(tmpdir)
+            if os.path.isdir('/dev/shm'):
+                assert tmpdir.startswith('/dev/shm/')
+
+
+def test_parallel_rmtree():
+    with temp_directory() as outside:
+        with open(os.path.join(outside, 'keep.txt'), 'w') as fp:
+            fp.write('keep')
+
+        with temp_directory(cleanup=parallel_rmtree) as tmpdir:
+            for i in range(300):
+                path = os.path.join(tmpdir, 'd%d' % i, 'sub')
+                os.makedirs(path)
+                open(os.path.join(path, 't.txt'), 'w').close()
+            for i in range(1200):
+                open(os.path.join(tmpdir, 'f%d' % i), 'w').close()
+            os.symlink(outside, os.path.join(tmpdir, 'link'))
+            os.symlink(outside, os.path.join(tmpdir, 'd0', 'sub', 'link'))
+
+        assert not os.path.exists(tmpdir)
+        assert os.listdir(outside) == ['keep.txt'], 'Symlinks must not be followed'
+
+        missing = os.path.join(outside, 'missing')
+        errors = []
+        parallel_rmtree(missing, onerror=lambda *args: errors.append(args))
+        assert len(errors) == 1
+        assert errors[0][1] == missing
+        assert isinstance(errors[0][2][1], OSError)
+
+        parallel_rmtree(missing, ignore_errors=True)
+        try:
+            parallel_rmtree(missing)
+            assert False, 'Should have raised an error for a missing directory'
+        except OSError:
+            pass
+
+
+def test_temp_directory_template():
+    with temp_directory() as template:
+        os.makedirs(os.path.join(template, 'sub', 'deeper'))
+        with open(os.path.join(template, 'sub', 'deeper', 'data.txt'), 'w') as fp:
+            fp.write('data')
+        with open(os.path.join(template, 'fixture.bin'), 'wb') as fp:
+            fp.write(b'\x00' * 4096)
+        os.chmod(os.path.join(template, 'fixture.bin'), stat.S_IRUSR | stat.S_IRGRP)
+        os.symlink('sub/deeper/data.txt', os.path.join(template, 'link'))
+
+        with temp_directory(template=template) as tmpdir:
+            with open(os.path.join(tmpdir, 'sub', 'deeper', 'data.txt')) as fp:
+                assert fp.read() == 'data'
+            with open(os.path.join(tmpdir, 'fixture.bin'), 'rb') as fp:
+                assert fp.read() == b'\x00' * 4096
+            assert os.readlink(os.path.join(tmpdir, 'link')) == 'sub/deeper/data.txt'
+
+            with open(os.path.join(tmpdir, 'sub', 'deeper', 'data.txt'), 'w') as fp:
+                fp.write('changed')
+            with open(os.path.join(template, 'sub', 'deeper', 'data.txt')) as fp:
+                assert fp.read() == 'data', 'Writable files must not be shared with the template'
+
+        assert not os.path.exists(tmpdir)
+        assert os.path.exists(os.path.join(template, 'fixture.bin'))
+
+        with temp_directory() as tmpdir:
+            result = clone_tree(template, tmpdir)
+            assert result.reflinked + result.linked + result.copied == 2
+            if not result.reflinked:
+                assert result.linked == 1
+                assert os.path.samefile(os.path.join(template, 'fixture.bin'), os.path.join(tmpdir, 'fixture.bin'))
+
+
+def run_with_timeout(func, *args, **kwargs):
+    outcome = []
+
+    def target():
+        try:
+            outcome.append((True, func(*args, **kwargs)))
+        except Exception as e:
+            outcome.append((False, e))
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(60)
+    assert outcome, '%s did not return' % func.__name__
+    return outcome[0]
+
+
+def test_parallel_rmtree_deep():
+    with temp_directory() as parent:
+        tmpdir = os.path.join(parent, 'deep')
+        os.mkdir(tmpdir)
+        fd = os.open(tmpdir, os.O_RDONLY)
+        for _ in range(1500):
+            os.mkdir('d', dir_fd=fd)
+            child = os.open('d', os.O_RDONLY, dir_fd=fd)
+            os.close(fd)
+            fd = child
+        os.close(fd)
+
+        assert run_with_timeout(parallel_rmtree, tmpdir) == (True, None)
+        assert not os.path.exists(tmpdir)
+
+
+def test_parallel_rmtree_unexpected_error(monkeypatch):
+    with temp_directory() as tmpdir:
+        for i in range(3):
+            os.makedirs(os.path.join(tmpdir, 'd%d' % i))
+            open(os.path.join(tmpdir, 'd%d' % i, 'boom'), 'w').close()
+
+        unlink = os.unlink
+
+        def broken_unlink(path, *args, **kwargs):
+            if path == 'boom':
+                raise RuntimeError('boom')
+            return unlink(path, *args, **kwargs)
+
+        monkeypatch.setattr(os, 'unlink', broken_unlink)
+        succeeded, error = run_with_timeout(parallel_rmtree, tmpdir)
+        monkeypatch.undo()
+
+        assert not succeeded
+        assert isinstance(error, RuntimeError)
+        assert os.path.isdir(tmpdir), 'Directories whose contents failed are left in place'
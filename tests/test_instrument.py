@@ -0,0 +1,128 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os
+import time
+
+from livetribe.utils import instrument
+from livetribe.utils.file import temp_directory
+from livetribe.utils.version import ensure_version, StandardVersion, version_for_package, VersionRange
+
+
+def test_instrument_disabled():
+    instrument.reset()
+    parse = StandardVersion.__dict__['parse']
+    lt = StandardVersion.__dict__['__lt__']
+
+    StandardVersion.parse('1.0') < StandardVersion.parse('2.0')
+    ensure_version('1.0', '1.0')
+    with temp_directory():
+        pass
+
+    assert not instrument.is_enabled()
+    assert instrument.snapshot() == {}
+
+    instrument.enable()
+    instrument.disable()
+    assert StandardVersion.__dict__['parse'] is parse
+    assert StandardVersion.__dict__['__lt__'] is lt
+
+
+def test_instrument():
+    exported = []
+    instrument.reset()
+    instrument.enable(exporter=exported.append)
+    try:
+        a = StandardVersion.parse('1.0')
+        b = StandardVersion.parse('2.0-RC1')
+        assert a < b and not a > b and a.__cmp__(b) < 0
+        assert VersionRange.parse('[1.0,2.0)').contains(a)
+        assert ensure_version('1.2', '1.0') == (True, '1.0')
+        try:
+            version_for_package('livetribe-utils-missing')
+        except LookupError:
+            pass
+        with temp_directory():
+            pass
+
+        metrics = instrument.snapshot()
+        assert metrics['StandardVersion.parse'].count == 4
+        assert metrics['StandardVersion.compare'].count == 4
+        assert metrics['VersionRange.contains'].count == 1
+        assert metrics['ensure_version'].count == 1
+        assert metrics['version_for_package'].count == 1
+        assert metrics['temp_directory.create'].count == 1
+        assert metrics['temp_directory.cleanup'].count == 1
+
+        parse = metrics['StandardVersion.parse']
+        assert sum(parse.histogram) == parse.count
+        assert len(parse.histogram) == len(instrument.BUCKETS) + 1
+        assert 0 <= parse.min <= parse.max <= parse.total
+
+        instrument.export()
+        assert exported[-1] == metrics
+
+        instrument.reset()
+        assert instrument.snapshot() == {}
+    finally:
+        instrument.disable()
+
+    assert instrument.snapshot() == {}
+    StandardVersion.parse('1.0')
+    assert instrument.snapshot() == {}
+
+
+def test_instrument_failures():
+    instrument.reset()
+    instrument.enable()
+    try:
+        def cleanup(path):
+            os.rmdir(path)
+            raise OSError(16, 'Device or resource busy', path)
+
+        try:
+            with temp_directory(cleanup=cleanup):
+                pass
+            assert False, 'Should have raised the cleanup error'
+        except OSError:
+            pass
+
+        try:
+            with temp_directory(template=os.path.join(os.path.dirname(__file__), 'missing')):
+                assert False, 'Should not enter with a missing template'
+        except OSError:
+            pass
+
+        metrics = instrument.snapshot()
+        assert metrics['temp_directory.create'].count == 2
+        assert metrics['temp_directory.cleanup'].count == 2
+    finally:
+        instrument.disable()
+
+
+def test_instrument_interval():
+    exported = []
+    instrument.reset()
+    instrument.enable(exporter=exported.append, interval=0.01)
+    try:
+        StandardVersion.parse('1.0')
+        deadline = time.time() + 5
+        while not exported and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        instrument.disable()
+
+    assert exported[0]['StandardVersion.parse'].count == 1
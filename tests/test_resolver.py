@@ -0,0 +1,130 @@
+#
+# Copyright 2013 the original author or authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import itertools
+import random
+from unittest import TestCase
+
+from livetribe.utils.resolver import Constraint, ResolutionError, Resolver
+from livetribe.utils.version import StandardVersion, VersionRange
+
+
+CANDIDATES = {
+    'app': ['1.0', '2.0'],
+    'web': ['1.0', '1.1', '2.0'],
+    'db': ['1.0', '2.0', '3.0'],
+    'log': ['1.0', '1.5', '2.0'],
+}
+
+DEPENDENCIES = {
+    ('app', '2.0'): {'web': '[2.0,)', 'db': '[3.0,)'},
+    ('app', '1.0'): {'web': '[1.0,2.0)', 'db': '[1.0,3.0)'},
+    ('web', '2.0'): {'log': '[2.0,)', 'db': '(,3.0)'},
+    ('web', '1.1'): {'log': '[1.5,2.0)'},
+    ('web', '1.0'): {'log': '[1.0,)'},
+    ('db', '3.0'): {'log': '2.0'},
+    ('db', '2.0'): {'log': '[1.0,2.0)'},
+}
+
+
+class TestResolver(TestCase):
+    def test_resolve_highest(self):
+        """ test the resolver picks the highest consistent versions """
+
+        resolver = Resolver(CANDIDATES, DEPENDENCIES)
+
+        # app 2.0 needs web 2.0 and db 3.0, but web 2.0 rejects db 3.0
+        assert resolver.resolve({'app': '1.0'}) == {
+            'app': StandardVersion(1),
+            'web': StandardVersion(1, 1),
+            'db': StandardVersion(2),
+            'log': StandardVersion(1, 5),
+        }
+        assert resolver.resolve({'db': '[1.0,)'}) == {'db': StandardVersion(3), 'log': StandardVersion(2)}
+        assert resolver.resolve({'web': '1.0', 'log': '[1.0,1.5)'}) == {'web': StandardVersion(1), 'log': StandardVersion(1)}
+
+
+    def test_resolve_conflict(self):
+        """ test the resolver reports a minimal set of conflicting requirements """
+
+        resolver = Resolver(CANDIDATES, DEPENDENCIES)
+
+        try:
+            resolver.resolve([('log', '[1.0,1.5)'), ('web', '[1.1,)'), ('app', '1.0'), ('db', '[3.0,)')])
+            assert False, 'Should have raised an exception for conflicting requirements'
+        except ResolutionError as error:
+            conflicts = set(error.conflicts)
+
+        assert conflicts in (set([Constraint(None, 'log', '[1.0,1.5)'), Constraint(None, 'web', '[1.1,)')]),
+                             set([Constraint(None, 'app', '1.0'), Constraint(None, 'db', '[3.0,)')]),
+                             set([Constraint(None, 'log', '[1.0,1.5)'), Constraint(None, 'db', '[3.0,)')]))
+        for conflict in conflicts:
+            remaining = [(c.package, c.versions) for c in conflicts if c is not conflict]
+            assert resolver.resolve(remaining) is not None, 'Reported conflict should be minimal'
+
+
+    def test_resolve_missing(self):
+        """ test the resolver handles unknown packages and versions """
+
+        resolver = Resolver({'a': ['1.0', '2.0'], 'b': ['1.0']},
+                            {('a', '2.0'): {'missing': '1.0'}, ('a', '1.0'): {'b': VersionRange.parse('[1.0]')}})
+
+        assert resolver.resolve({'a': '1.0'}) == {'a': StandardVersion(1), 'b': StandardVersion(1)}
+
+        try:
+            resolver.resolve({'a': '[2.0,)'})
+            assert False, 'Should have raised an exception for a missing dependency'
+        except ResolutionError as error:
+            assert error.conflicts == [Constraint(None, 'a', '[2.0,)')]
+
+
+    def test_resolve_random(self):
+        """ test the resolver agrees with a brute force search on small graphs """
+
+        rng = random.Random(3)
+        for _ in range(40):
+            packages = ['p%d' % i for i in range(5)]
+            candidates = dict((p, ['%d.0' % v for v in range(1, 4)]) for p in packages)
+            dependencies = {}
+            for i, package in enumerate(packages):
+                for version in candidates[package]:
+                    requirements = {}
+                    for dependency in rng.sample(packages[i + 1:], min(2, len(packages) - i - 1)):
+                        low = rng.randrange(1, 4)
+                        requirements[dependency] = '[%d.0,%d.0]' % (low, rng.randrange(low, 4))
+                    dependencies[(package, version)] = requirements
+            resolver = Resolver(candidates, dependencies)
+
+            def consistent(assignment):
+                if assignment.get('p0') is None:
+                    return False
+                for (package, version), requirements in dependencies.items():
+                    if assignment.get(package) == StandardVersion.parse(version):
+                        for dependency, spec in requirements.items():
+                            if assignment.get(dependency) is None or not VersionRange.parse(spec).contains(assignment[dependency]):
+                                return False
+                return True
+
+            versions = [[None] + [StandardVersion.parse(v) for v in candidates[p]] for p in packages]
+            exists = any(consistent(dict(zip(packages, combination))) for combination in itertools.product(*versions))
+
+            try:
+                solution = resolver.resolve({'p0': '1.0'})
+            except ResolutionError:
+                solution = None
+
+            assert (solution is not None) == exists
+            assert solution is None or consistent(solution)
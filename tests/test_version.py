@@ -14,9 +14,71 @@
 # specific language governing permissions and limitations
 # under the License.
 #
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import pickle
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
 from unittest import TestCase
 
-from livetribe.utils.version import StandardVersion, VersionRange
+from livetribe.utils.file import temp_directory
+from livetribe.utils.version import compile_range, ensure_version, RequirementFailure, RequirementSet, StandardVersion, VersionIndex, VersionRange, VersionRangeIndex, VersionSet, \
+    invalidate_distributions, scan_versions, sort_catalog, VersionArray, version_for_package, versions_for_packages
+
+
+IMPORT_BUDGET = 0.25
+
+
+def test_import_time():
+    """ importing the version module must stay cheap """
+
+    script = ('import sys, time\n'
+              'start = time.time()\n'
+              'import livetribe.utils.version\n'
+              'print(time.time() - start)\n'
+              'print("pkg_resources" in sys.modules)\n')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    elapsed, pkg_resources = subprocess.check_output([sys.executable, '-c', script], env=env).decode().split()
+
+    assert pkg_resources == 'False', 'pkg_resources should not be imported'
+    assert float(elapsed) < IMPORT_BUDGET, 'import took %ss, budget is %ss' % (elapsed, IMPORT_BUDGET)
+
+
+def test_version_for_package():
+    assert version_for_package('setuptools')
+
+    try:
+        version_for_package('livetribe-no-such-package')
+        assert False, 'Should have raised an exception for a missing package'
+    except LookupError:
+        pass
+
+
+def test_versions_for_packages():
+    with temp_directory() as tmpdir:
+        dist_info = os.path.join(tmpdir, 'livetribe_fake-1.2.3.dist-info')
+        os.mkdir(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as fp:
+            fp.write('Metadata-Version: 2.1\nName: livetribe-fake\nVersion: 1.2.3\n')
+
+        assert versions_for_packages(['livetribe-fake']) == {'livetribe-fake': None}
+
+        sys.path.append(tmpdir)
+        try:
+            versions = versions_for_packages(['livetribe-fake', 'livetribe_Fake', 'livetribe-no-such-package'])
+            assert versions == {'livetribe-fake': StandardVersion(1, 2, 3),
+                                'livetribe_Fake': StandardVersion(1, 2, 3),
+                                'livetribe-no-such-package': None}
+            assert version_for_package('livetribe-fake') == '1.2.3'
+        finally:
+            sys.path.remove(tmpdir)
+
+        assert versions_for_packages(['livetribe-fake']) == {'livetribe-fake': None}
 
 
 class TestStandardVersion(TestCase):
@@ -101,8 +163,341 @@ class TestStandardVersion(TestCase):
         assert StandardVersion.parse('1.0.0-A') < StandardVersion.parse('1.0.0-B')
         assert StandardVersion.parse('1.0.0-A') < StandardVersion.parse('1.0.0'), 'Version with qualifier should be less than one without'
 
+        assert StandardVersion.parse('1.0.0') <= StandardVersion.parse('1.0')
+        assert StandardVersion.parse('1.0.1') > StandardVersion.parse('1.0.1-A')
+        assert StandardVersion.parse('1.0.1') >= '1.0.1'
+        assert StandardVersion.parse('1.0.1') != '1.0.2'
+        assert StandardVersion.parse('1.0') != None
+        assert StandardVersion.parse('1.0').__cmp__('1.0.0') == 0
+
+        versions = [StandardVersion.parse(v) for v in ('1.1', '1.0-B', '0.9', '1.0', '1.0-A')]
+        assert [str(v) for v in sorted(versions)] == ['0.9', '1.0-A', '1.0-B', '1.0', '1.1']
+        assert str(max(versions)) == '1.1'
+
+
+    def test_std_qualifier_order(self):
+        """ test tokenized qualifier ordering for StandardVersion """
+
+        assert StandardVersion.parse('1.0-RC2') < StandardVersion.parse('1.0-RC10')
+        assert StandardVersion.parse('1.2.1102-RC2.4622') < StandardVersion.parse('1.2.1102-RC2.10000')
+        assert StandardVersion.parse('1.2.1102-RC2.4622') < StandardVersion.parse('1.2.1102-RC10.1')
+        assert StandardVersion.parse('1.0-rc.2') == StandardVersion.parse('1.0-RC2')
+        assert hash(StandardVersion.parse('1.0-rc.2')) == hash(StandardVersion.parse('1.0-RC2'))
+
+        ordered = ['1.0-dev1', '1.0-alpha', '1.0-alpha2', '1.0-Beta1', '1.0-Milestone3', '1.0-rc1', '1.0-SNAPSHOT', '1.0']
+        shuffled = list(reversed(ordered))
+        assert [str(v) for v in sorted(StandardVersion.parse(v) for v in shuffled)] == ordered
+
+        for release in ('1.0-GA', '1.0-final', '1.0-Release'):
+            assert StandardVersion.parse(release) == StandardVersion.parse('1.0')
+            assert hash(StandardVersion.parse(release)) == hash(StandardVersion.parse('1.0'))
+            assert str(StandardVersion.parse(release)) == release
+        assert StandardVersion.parse('1.0-GA') > StandardVersion.parse('1.0-SNAPSHOT')
+        assert StandardVersion.parse('1.0-GA2') < StandardVersion.parse('1.0')
+        assert ensure_version('1.0-GA', '1.0') == (True, '1.0')
+        assert VersionRange.parse('[1.0,2.0)').contains('1.0-final')
+
+        class ReleaseFirst(StandardVersion):
+            __slots__ = ()
+            qualifier_precedence = {'release': 0, 'rc': 1}
+
+        assert ReleaseFirst.parse('1.0-release') < ReleaseFirst.parse('1.0-rc1')
+        assert StandardVersion.parse('1.0-release') > StandardVersion.parse('1.0-rc1')
+
+
+    def test_std_immutable(self):
+        """ test StandardVersion instances are immutable """
+
+        version = StandardVersion.parse('1.2.3-YOKO')
+
+        assert not hasattr(version, '__dict__')
+        try:
+            version.qualifier = 'NOBU'
+            assert False, 'Should have raised an exception for assignment'
+        except AttributeError:
+            pass
+
+        test = set([version])
+
+        assert version.increment_major() == StandardVersion(2, 2, 3, 'YOKO')
+        assert version.increment_minor() == StandardVersion(1, 3, 3, 'YOKO')
+        assert version.increment_micro() == StandardVersion(1, 2, 4, 'YOKO')
+        assert version == StandardVersion.parse('1.2.3-YOKO')
+        assert version in test
+
+
+    def test_std_pickle(self):
+        """ test pickling of StandardVersion """
+
+        version = StandardVersion.parse('1.2.3-YOKO')
+
+        assert pickle.loads(pickle.dumps(version)) == version
+        assert pickle.loads(pickle.dumps(version)).qualifier == 'YOKO'
+
+
+    def test_std_parse_many(self):
+        """ test batch parsing of StandardVersion """
+
+        rows = ['1.2.3-YOKO', 'Z.0', '1.2', None, '2']
+        versions, invalid = StandardVersion.parse_many(rows)
+
+        assert versions == [StandardVersion(1, 2, 3, 'YOKO'), None, StandardVersion(1, 2), None, StandardVersion(2)]
+        assert list(invalid) == [1, 3]
+
+        with ThreadPoolExecutor(2) as executor:
+            result = StandardVersion.parse_many(iter(rows), executor=executor, chunksize=2)
+
+        assert result.versions == versions
+        assert list(result.invalid) == [1, 3]
+
+    def test_std_parse_buffer(self):
+        """ test parsing StandardVersion from byte buffers """
+
+        frame = b'\x00\x07ver=1.2.3-RC1;'
+        for buffer in (frame, bytearray(frame), memoryview(frame)):
+            assert StandardVersion.parse_buffer(buffer, 6, 9) == StandardVersion(1, 2, 3, 'RC1')
+            assert StandardVersion.parse_buffer(buffer, 6, 9).qualifier == 'RC1'
+            assert StandardVersion.parse_buffer(buffer, 6, 3) == StandardVersion(1, 2)
+
+        assert StandardVersion.parse_buffer(b'2.0') == StandardVersion(2)
+
+        for offset, length in ((2, 7), (6, 10), (6, 2), (6, 50), (-9, 9), (6, -1), (30, None)):
+            try:
+                StandardVersion.parse_buffer(frame, offset, length)
+                assert False, 'Should have raised an exception for bad version field %s, %s' % (offset, length)
+            except ValueError:
+                pass
+
+        for offset, length in ((0, 50), (-3, None)):
+            try:
+                StandardVersion.parse_buffer(b'1.2.3', offset, length)
+                assert False, 'Should have raised an exception for a field outside the buffer'
+            except ValueError:
+                pass
+
+    def test_std_parse_packed(self):
+        """ test parsing length-prefixed StandardVersion fields """
+
+        rows = ['1.2.3-RC1', '2.0', '10']
+        packed = b''.join(struct.pack('>H', len(row)) + row.encode('ascii') for row in rows)
+        expected = [StandardVersion.parse(row) for row in rows]
+
+        assert StandardVersion.parse_packed(packed) == expected
+        assert StandardVersion.parse_packed(memoryview(b'xx' + packed + b'tail'), offset=2, count=3) == expected
+        assert StandardVersion.parse_packed(bytearray(packed), count=0) == []
+
+        little = b''.join(struct.pack('<I', len(row)) + row.encode('ascii') for row in rows)
+        assert StandardVersion.parse_packed(little, prefix='<I') == expected
+
+        for bad in (packed[:-1], packed + b'\x00', struct.pack('>H', 3) + b'1.x'):
+            try:
+                StandardVersion.parse_packed(bad)
+                assert False, 'Should have raised an exception for bad fields'
+            except ValueError:
+                pass
+
+        for offset in (-5, len(packed) + 1):
+            try:
+                StandardVersion.parse_packed(packed, offset)
+                assert False, 'Should have raised an exception for an offset outside the buffer'
+            except ValueError:
+                pass
+
+
+    def test_std_packed_key(self):
+        """ test packed keys for StandardVersion """
+
+        ordered = [StandardVersion.parse(v) for v in ('0.9', '1.0-alpha', '1.0-rc', '1.0-RC2', '1.0-rc10', '1.0-SNAPSHOT', '1.0', '1.0.1', '1.1', '65535.0')]
+        keys = [v.to_key() for v in ordered]
+
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+        assert all(len(key) == 8 for key in keys)
+        assert [int.from_bytes(key, 'big') for key in keys] == sorted(int.from_bytes(key, 'big') for key in keys)
+        assert StandardVersion.parse('1.0-RC.2').to_key() == StandardVersion.parse('1.0-rc2').to_key()
+        assert StandardVersion.parse('1.0-GA').to_key() == StandardVersion.parse('1.0').to_key()
+        assert [StandardVersion.from_key(key) for key in keys] == ordered
+        assert str(StandardVersion.from_key(StandardVersion.parse('1.0-RC2').to_key())) == '1.0-rc2'
+
+        packed = StandardVersion.to_keys(ordered)
+        assert StandardVersion.from_keys(pickle.loads(pickle.dumps(packed))) == ordered
+
+        try:
+            StandardVersion.parse('65536.0').to_key()
+            assert False, 'Should have raised an exception for unpackable version'
+        except OverflowError:
+            pass
+
+        for key in (b'\x00\x01', b'\x00' * 6 + b'\x78\x00', b'\x00\x01' + b'\x00' * 4 + b'\xff\xff\x03', StandardVersion.parse('1.0-rc').to_key() + b'\x09'):
+            try:
+                StandardVersion.from_key(key)
+                assert False, 'Should have raised an exception for bad key %r' % key
+            except ValueError:
+                pass
+
+
+    def test_std_packed_key_overflow(self):
+        """ test packed keys for qualifiers beyond a label and a number """
+
+        exotic = ('1.2.1102-RC2.4622', '1.2.1102-RC2.10000', '1.2.1102-RC10.1', '1.2.1102-RC2', '1.2.1102-RC3',
+                  '1.2.3-YOKO', '1.2.3-SNAPSHOT-20130101', '1.2.3-SNAPSHOT', '1.2.3-SNAPSHOT-20130102', '1.2.3-SNAPSHOT.YOKO',
+                  '1.2.3-rc1.2', '1.2.3-rc2047', '1.2.3-rc2045', '1.2.3-rc.beta', '1.2.3-2', '1.2.3-10', '1.2.3-yoko',
+                  '1.2.3-alpha-YOKO', '1.2.3-_', '1.2.3', '1.2.3-rc' + '9' * 40)
+        versions = [StandardVersion.parse(v) for v in exotic]
+        random.seed(13)
+        random.shuffle(versions)
+
+        keys = StandardVersion.to_keys(versions)
+        assert [StandardVersion.from_key(key) for key in sorted(keys)] == sorted(versions)
+        assert len(set(keys)) == len(set(versions))
+        assert StandardVersion.parse('1.2.1102-rc.2.4622').to_key() == StandardVersion.parse('1.2.1102-RC2.4622').to_key()
+        assert str(StandardVersion.from_key(StandardVersion.parse('1.2.1102-RC2.4622').to_key())) == '1.2.1102-rc2.4622'
+        assert str(StandardVersion.from_key(StandardVersion.parse('1.2.3-SNAPSHOT-20130101').to_key())) == '1.2.3-snapshot20130101'
+        assert str(StandardVersion.from_key(StandardVersion.parse('1.2.3-YOKO').to_key())) == '1.2.3-YOKO'
+
+
+    def test_std_cache(self):
+        """ test the parse cache for StandardVersion """
+
+        assert StandardVersion.cache_info() is None
+
+        StandardVersion.enable_cache(2, shards=1)
+        try:
+            version = StandardVersion.parse('1.2.3-YOKO')
+
+            assert StandardVersion.parse('1.2.3-YOKO') is version
+            assert StandardVersion.parse('1.0') is StandardVersion.parse('1'), 'Equal versions should be interned'
+
+            StandardVersion.parse('2.0')
+            info = StandardVersion.cache_info()
+            assert info.hits == 1
+            assert info.misses == 4
+            assert info.evictions == 2
+            assert info.currsize == 2
+
+            try:
+                StandardVersion.parse('Z.0')
+                assert False, 'Should have raised an exception for bad version'
+            except ValueError:
+                pass
+        finally:
+            StandardVersion.disable_cache()
+
+        assert StandardVersion.parse('1.2.3-YOKO') is not StandardVersion.parse('1.2.3-YOKO')
+
+    def test_std_cache_subclass(self):
+        """ test subclasses do not share the StandardVersion parse cache """
+
+        class ReleaseFirst(StandardVersion):
+            __slots__ = ()
+            qualifier_precedence = {'release': 0, 'rc': 1}
+
+        StandardVersion.enable_cache()
+        try:
+            StandardVersion.parse('1.0-release')
+            StandardVersion.parse('1.0-rc1')
+
+            release = ReleaseFirst.parse('1.0-release')
+            assert type(release) is ReleaseFirst
+            assert release < ReleaseFirst.parse('1.0-rc1')
+            assert ReleaseFirst.cache_info() is None
+
+            ReleaseFirst.enable_cache()
+            assert ReleaseFirst.parse('1.0-rc1') is ReleaseFirst.parse('1.0-rc1')
+            assert type(StandardVersion.parse('1.0-rc1')) is StandardVersion
+            assert StandardVersion.cache_info().hits == 1
+        finally:
+            ReleaseFirst.disable_cache()
+            StandardVersion.disable_cache()
+
+        class Range(VersionRange):
+            pass
+
+        VersionRange.enable_cache()
+        try:
+            VersionRange.parse('[1.0,2.0)')
+            assert type(Range.parse('[1.0,2.0)')) is Range
+        finally:
+            VersionRange.disable_cache()
+
+
+def test_scan_versions():
+    log = b'fetched requests-2.31.0.tar.gz at 12:30\nbuilt 1.2.3-RC1, skipped 1.2.3.4 and x1.2\nreleased 1.5.\n'
+    expected = [(log.index(b'2.31.0'), StandardVersion(2, 31, 0)),
+                (log.index(b'1.2.3-RC1'), StandardVersion(1, 2, 3, 'RC1')),
+                (log.index(b'1.5.'), StandardVersion(1, 5))]
+
+    assert list(scan_versions(log)) == expected
+    assert list(scan_versions(memoryview(bytearray(log)))) == expected
+
+    tail = b'built 1.2.3-rc1. next tag v2.0.1, skipped xv3.0\n'
+    assert list(scan_versions(tail)) == [(tail.index(b'1.2.3'), StandardVersion(1, 2, 3, 'rc1')), (tail.index(b'2.0.1'), StandardVersion(2, 0, 1))]
+    assert [version.qualifier for _, version in scan_versions(tail)] == ['rc1', None]
+
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'build.log')
+        with open(path, 'wb') as fp:
+            fp.write(log * 1000)
+
+        found = list(scan_versions(path))
+        assert len(found) == 3000
+        assert found[3] == (len(log) + expected[0][0], StandardVersion(2, 31, 0))
+
+        with open(path, 'rb') as fp:
+            assert next(scan_versions(fp)) == expected[0]
+
+        open(path, 'wb').close()
+        assert list(scan_versions(path)) == []
+
+
+def test_sort_catalog():
+    rng = random.Random(17)
+    rows = [(rng.choice('abc'), '%d.%d%s' % (rng.randrange(3), rng.randrange(3), rng.choice(['', '.0', '-rc1', '-SNAPSHOT'])))
+            for _ in range(500)]
+    rows[7] = ('a', 'bogus')
+    rows[300] = ('b', None)
+
+    valid = [(artifact, StandardVersion.parse(version), version) for artifact, version in rows if version not in ('bogus', None)]
+    everything = [(artifact, version) for artifact, _, version in sorted(valid, key=lambda row: (row[0], row[1], row[2]))]
+    unique = []
+    for artifact, version in everything:
+        if not unique or unique[-1][0] != artifact or StandardVersion.parse(unique[-1][1]) != StandardVersion.parse(version):
+            unique.append((artifact, version))
+
+    result = sort_catalog(rows)
+    assert list(result.rows) == unique
+    assert list(result.invalid) == [7, 300]
+
+    assert list(sort_catalog(iter(rows), unique=False).rows) == everything
+
+    with ThreadPoolExecutor(2) as executor:
+        result = sort_catalog(rows, executor=executor, chunksize=64)
+        assert list(result.rows) == unique
+        assert list(result.invalid) == [7, 300]
+        assert list(sort_catalog(rows, executor=executor, chunksize=64, unique=False).rows) == everything
+
+    with ProcessPoolExecutor(2) as executor:
+        assert list(sort_catalog(rows, executor=executor, chunksize=100).rows) == unique
+
 
 class TestVersionRange(TestCase):
+    def test_range_parse_buffer(self):
+        """ test parsing VersionRange from byte buffers """
+
+        for spec in ('[1.0,2.0)', '(,1.5-RC1]', '[1.2.3]', '( 1.0 , )'):
+            frame = b'<<' + spec.encode('ascii') + b'>>'
+            for buffer in (frame, bytearray(frame), memoryview(frame)):
+                assert VersionRange.parse_buffer(buffer, 2, len(spec)) == VersionRange.parse(spec)
+
+        assert VersionRange.parse_buffer(b'[1.0,)').start_include
+
+        for offset, length in ((2, None), (2, 50), (-11, 9)):
+            try:
+                VersionRange.parse_buffer(b'<<[1.0,2.0)>>', offset, length)
+                assert False, 'Should have raised an exception for bad version range field %s, %s' % (offset, length)
+            except ValueError:
+                pass
+
     def test_range_parse(self):
         try:
             VersionRange.parse('{1.0, 2.0)')
@@ -121,6 +516,61 @@ class TestVersionRange(TestCase):
         assert VersionRange.parse('(1.0, 2.0)') == VersionRange(StandardVersion(1), False, StandardVersion(2), False)
 
 
+    def test_range_parse_unbounded(self):
+        """ test parsing of unbounded and exact version ranges """
+
+        assert VersionRange.parse('[1.0,)') == VersionRange(StandardVersion(1), True, None, False)
+        assert VersionRange.parse('(,2.0]') == VersionRange(None, False, StandardVersion(2), True)
+        assert VersionRange.parse('(,)') == VersionRange(None, False, None, False)
+        assert VersionRange.parse('[1.5]') == VersionRange(StandardVersion(1, 5), True, StandardVersion(1, 5), True)
+        assert str(VersionRange.parse('[1.0,)')) == '[1.0, )'
+        assert VersionRange.parse(str(VersionRange.parse('(,2.0]'))) == VersionRange.parse('(,2.0]')
+
+        assert VersionRange.parse_all('[1.0,2.0),[3.0,)') == [VersionRange.parse('[1.0, 2.0)'), VersionRange.parse('[3.0,)')]
+        assert VersionRange.parse_all(' [1.0] , (2.0,3.0) ') == [VersionRange.parse('[1.0]'), VersionRange.parse('(2.0, 3.0)')]
+        for spec in ('', '[1.0,2.0),', '[1.0,2.0)[3.0,)', '[1.0,2.0),3.0'):
+            try:
+                VersionRange.parse_all(spec)
+                assert False, 'Should have raised an exception for bad version range %r' % spec
+            except ValueError:
+                pass
+
+
+    def test_range_immutable(self):
+        """ test VersionRange instances are immutable """
+
+        version_range = VersionRange.parse('[1.0, 2.0)')
+        try:
+            version_range.start = StandardVersion(0)
+            assert False, 'Should have raised an exception for assignment'
+        except AttributeError:
+            pass
+
+        assert pickle.loads(pickle.dumps(version_range)) == version_range
+
+
+    def test_range_matcher(self):
+        """ test compiled range matchers """
+
+        versions = [StandardVersion.parse(v) for v in ('0.9', '1.0', '1.5', '2.0', '2.5', '3.0', '4.0')]
+
+        matcher = compile_range('[1.0,2.0),[3.0,)')
+        assert compile_range('[1.0,2.0),[3.0,)') is matcher
+        assert [str(v) for v in matcher.filter(versions)] == ['1.0', '1.5', '3.0', '4.0']
+        assert matcher('3.0')
+        assert not matcher.matches(StandardVersion.parse('2.0'))
+
+        matcher = VersionRange.parse('(1.0, 2.0]').matcher()
+        assert [str(v) for v in matcher.filter(versions)] == ['1.5', '2.0']
+        assert not matcher('1.0')
+        assert matcher('1.0.1-A')
+
+        assert compile_range('[1.0,2.0)').filter(['0.9', '1.5', StandardVersion.parse('1.6'), '2.0']) == ['1.5', StandardVersion.parse('1.6')]
+        assert matcher.filter(['1.5', '2.5']) == ['1.5']
+
+        assert VersionSet.parse('[1.0,2.0),[2.0,3.0)') == VersionSet.parse('[1.0,3.0)')
+
+
     def test_range_checking(self):
         """ test version range checking """
 
@@ -136,12 +586,42 @@ class TestVersionRange(TestCase):
         assert VersionRange.parse('(1.0, 2.0]').contains(StandardVersion.parse('2'))
         assert not VersionRange.parse('(1.0, 2.0)').contains(StandardVersion.parse('5'))
 
+        assert VersionRange.parse('[1.0,)').contains(StandardVersion.parse('500'))
+        assert not VersionRange.parse('(1.0,)').contains(StandardVersion.parse('1.0'))
+        assert VersionRange.parse('(,2.0]').contains(StandardVersion.parse('0.1'))
+        assert VersionRange.parse('(,2.0]').contains('2.0')
+        assert VersionRange.parse('[1.5]').contains(StandardVersion.parse('1.5.0'))
+        assert not VersionRange.parse('[1.5]').contains(StandardVersion.parse('1.5-A'))
+
 
     def test_range_equals(self):
         """ test equals override for VersionRange """
 
         assert VersionRange.parse('(1.0, 2.0)') is not VersionRange.parse('(1.0, 2.0)'), 'Two instances of StandardVersion are not the same'
         assert VersionRange.parse('(1.0, 2.0)') == VersionRange.parse('(1.0, 2.0)')
+        assert VersionRange.parse('[1.0-rc2, 2.0)') == VersionRange.parse('[1.0-RC.2, 2.0)'), 'Equal bounds spelt differently'
+        assert not (VersionRange.parse('[1.0-rc2, 2.0)') != VersionRange.parse('[1.0-RC.2, 2.0)'))
+        assert hash(VersionRange.parse('[1.0-rc2, 2.0)')) == hash(VersionRange.parse('[1.0-RC.2, 2.0)'))
+        assert VersionRange.parse('[1.0, 2.0)') != VersionRange.parse('[1.0, 2.0]')
+        assert VersionRange.parse('(,2.0)') != VersionRange.parse('(1.0,2.0)')
+
+
+    def test_range_cache(self):
+        """ test the parse cache for VersionRange """
+
+        assert VersionRange.cache_info() is None
+
+        StandardVersion.enable_cache()
+        VersionRange.enable_cache()
+        try:
+            version_range = VersionRange.parse('[1.0, 2.0)')
+
+            assert VersionRange.parse('[1.0, 2.0)') is version_range
+            assert VersionRange.parse('[1.0, 3.0)').start is version_range.start
+            assert VersionRange.cache_info().hits == 1
+        finally:
+            VersionRange.disable_cache()
+            StandardVersion.disable_cache()
 
 
     def test_range_not_equals(self):
@@ -184,3 +664,361 @@ class TestVersionRange(TestCase):
         assert repr(VersionRange.parse('(1.0, 2.0]')) == "VersionRange(StandardVersion(1, 0, 0, None), False, StandardVersion(2, 0, 0, None), True)"
         assert repr(VersionRange.parse('[1.0, 2.0)')) == "VersionRange(StandardVersion(1, 0, 0, None), True, StandardVersion(2, 0, 0, None), False)"
         assert repr(VersionRange.parse('[1.0, 2.0]')) == "VersionRange(StandardVersion(1, 0, 0, None), True, StandardVersion(2, 0, 0, None), True)"
+
+
+class TestVersionIndex(TestCase):
+    def setUp(self):
+        self.index = VersionIndex(StandardVersion.parse(v) for v in ('2.0', '1.0', '1.5', '1.2-RC1', '1.2', '3.1', '1.0.0'))
+
+    def test_index_order(self):
+        """ test VersionIndex keeps a sorted set of versions """
+
+        assert [str(v) for v in self.index] == ['1.0', '1.2-RC1', '1.2', '1.5', '2.0', '3.1']
+        assert StandardVersion.parse('1.5') in self.index
+        assert StandardVersion.parse('1.6') not in self.index
+
+        assert self.index.add(StandardVersion.parse('1.6'))
+        assert not self.index.add(StandardVersion.parse('1.6.0'))
+        assert self.index.discard(StandardVersion.parse('1.0'))
+        assert not self.index.discard(StandardVersion.parse('1.0'))
+        assert [str(v) for v in self.index] == ['1.2-RC1', '1.2', '1.5', '1.6', '2.0', '3.1']
+
+        try:
+            self.index.remove(StandardVersion.parse('9.0'))
+            assert False, 'Should have raised an exception for missing version'
+        except KeyError:
+            pass
+
+
+    def test_index_neighbours(self):
+        """ test VersionIndex floor, ceiling and nearest lookups """
+
+        assert self.index.floor(StandardVersion.parse('1.5')) == StandardVersion.parse('1.5')
+        assert self.index.floor(StandardVersion.parse('1.9')) == StandardVersion.parse('1.5')
+        assert self.index.floor(StandardVersion.parse('0.9')) is None
+        assert self.index.ceiling(StandardVersion.parse('1.2-alpha')) == StandardVersion.parse('1.2-RC1')
+        assert self.index.ceiling(StandardVersion.parse('3.2')) is None
+        assert self.index.lower(StandardVersion.parse('1.5')) == StandardVersion.parse('1.2')
+        assert self.index.higher(StandardVersion.parse('1.5')) == StandardVersion.parse('2.0')
+
+        assert self.index.nearest(StandardVersion.parse('1.5')) == StandardVersion.parse('1.5')
+        assert self.index.nearest(StandardVersion.parse('1.9')) == StandardVersion.parse('1.5')
+        assert self.index.nearest(StandardVersion.parse('3.0')) == StandardVersion.parse('3.1')
+        assert self.index.nearest(StandardVersion.parse('1.6')) == StandardVersion.parse('1.5')
+        assert self.index.nearest(StandardVersion.parse('9.0')) == StandardVersion.parse('3.1')
+        assert VersionIndex().nearest(StandardVersion.parse('1.0')) is None
+
+
+    def test_index_range(self):
+        """ test VersionIndex range queries """
+
+        assert [str(v) for v in self.index.range(VersionRange.parse('[1.2, 2.0)'))] == ['1.2', '1.5']
+        assert [str(v) for v in self.index.range(VersionRange.parse('(1.2, 2.0]'))] == ['1.5', '2.0']
+        assert self.index.range(VersionRange.parse('[2.1, 3.0]')) == []
+        assert self.index.range(VersionRange(None, False, StandardVersion(1, 2), False)) == [StandardVersion.parse('1.0'), StandardVersion.parse('1.2-RC1')]
+        assert self.index.count(VersionRange(StandardVersion(1, 5), True, None, False)) == 3
+
+        assert self.index.latest() == StandardVersion.parse('3.1')
+        assert self.index.latest(VersionRange.parse('[1.0, 2.0)')) == StandardVersion.parse('1.5')
+        assert self.index.latest(VersionRange.parse('[2.1, 3.0]')) is None
+
+
+class TestVersionRangeIndex(TestCase):
+    def test_range_index_find(self):
+        """ test VersionRangeIndex stabbing queries """
+
+        closed = VersionRange.parse('[1.0, 2.0]')
+        open_ = VersionRange.parse('(1.0, 2.0)')
+        later = VersionRange.parse('[2.0, 3.0)')
+        below = VersionRange(None, False, StandardVersion(1, 5), True)
+        empty = VersionRange.parse('(1.0, 1.0)')
+        index = VersionRangeIndex([closed, open_, later, below, empty])
+
+        assert set(index.find(StandardVersion.parse('0.1'))) == set([below])
+        assert set(index.find(StandardVersion.parse('1.0'))) == set([closed, below])
+        assert set(index.find(StandardVersion.parse('1.5'))) == set([closed, open_, below])
+        assert set(index.find(StandardVersion.parse('2.0'))) == set([closed, later])
+        assert index.find(StandardVersion.parse('3.0')) == []
+
+        index.remove(below)
+        assert set(index.find(StandardVersion.parse('1.0'))) == set([closed])
+        assert len(index) == 4
+
+
+    def test_range_index_matches_contains(self):
+        """ test VersionRangeIndex agrees with VersionRange.contains """
+
+        rng = random.Random(7)
+
+        def version():
+            return StandardVersion(rng.randrange(4), rng.randrange(4), 0, rng.choice([None, 'A']))
+
+        ranges = []
+        for _ in range(200):
+            start, end = sorted([version(), version()])
+            ranges.append(VersionRange(rng.choice([start, None]), rng.random() < 0.5, rng.choice([end, end, None]), rng.random() < 0.5))
+        index = VersionRangeIndex(ranges)
+        versions = [version() for _ in range(100)]
+
+        batch = index.find_many(versions)
+        for v, found in zip(versions, batch):
+            expected = sorted(id(r) for r in ranges if r.contains(v))
+            assert sorted(id(r) for r in index.find(v)) == expected
+            assert sorted(id(r) for r in found) == expected
+
+
+class TestVersionSet(TestCase):
+    def test_set_normalize(self):
+        """ test VersionSet merges ranges into disjoint intervals """
+
+        version_set = VersionSet([VersionRange.parse('[2.0, 3.0)'), VersionRange.parse('[1.0, 2.0)'), VersionRange.parse('(4.0, 5.0)'), VersionRange.parse('[1.5, 1.8]')])
+
+        assert version_set.ranges() == [VersionRange.parse('[1.0, 3.0)'), VersionRange.parse('(4.0, 5.0)')]
+        assert str(version_set) == '[1.0, 3.0),(4.0, 5.0)'
+        assert StandardVersion.parse('2.0') in version_set
+        assert StandardVersion.parse('3.0') not in version_set
+        assert StandardVersion.parse('4.0') not in version_set
+        assert StandardVersion.parse('4.5') in version_set
+
+        assert VersionSet([VersionRange.parse('[1.0, 2.0)'), VersionRange.parse('(2.0, 3.0)')]).ranges() == [VersionRange.parse('[1.0, 2.0)'), VersionRange.parse('(2.0, 3.0)')]
+        assert VersionSet([VersionRange.parse('(1.0, 1.0)')]).is_empty()
+
+
+    def test_set_algebra(self):
+        """ test VersionSet union, intersection, difference and complement """
+
+        a = VersionSet([VersionRange.parse('[1.0, 3.0)')])
+        b = VersionSet([VersionRange.parse('[2.0, 4.0]')])
+
+        assert (a | b).ranges() == [VersionRange.parse('[1.0, 4.0]')]
+        assert (a & b).ranges() == [VersionRange.parse('[2.0, 3.0)')]
+        assert (a - b).ranges() == [VersionRange.parse('[1.0, 2.0)')]
+        assert (b - a).ranges() == [VersionRange.parse('[3.0, 4.0]')]
+        assert (~a).ranges() == [VersionRange(None, False, StandardVersion(1), False), VersionRange(StandardVersion(3), True, None, False)]
+        assert ~~a == a
+        assert (a | ~a) == VersionSet.all()
+        assert (a & ~a).is_empty()
+        assert not VersionSet()
+        assert (a & b) <= a
+        assert not (a <= b)
+        assert a.issuperset(a & b)
+        assert a.isdisjoint(VersionSet([VersionRange.parse('[3.0, 4.0]')]))
+
+
+    def test_set_matches_contains(self):
+        """ test VersionSet agrees with VersionRange.contains """
+
+        rng = random.Random(11)
+
+        def version():
+            return StandardVersion(rng.randrange(4), rng.randrange(4), 0, rng.choice([None, 'A']))
+
+        def ranges():
+            found = []
+            for _ in range(5):
+                start, end = sorted([version(), version()])
+                found.append(VersionRange(rng.choice([start, None]), rng.random() < 0.5, rng.choice([end, end, None]), rng.random() < 0.5))
+            return found
+
+        for _ in range(50):
+            a_ranges = ranges()
+            b_ranges = ranges()
+            a = VersionSet(a_ranges)
+            b = VersionSet(b_ranges)
+            for v in [version() for _ in range(20)]:
+                in_a = any(r.contains(v) for r in a_ranges)
+                in_b = any(r.contains(v) for r in b_ranges)
+                assert (v in a) == in_a
+                assert (v in (a | b)) == (in_a or in_b)
+                assert (v in (a & b)) == (in_a and in_b)
+                assert (v in (a - b)) == (in_a and not in_b)
+                assert (v in ~a) == (not in_a)
+                assert any(r.contains(v) for r in a.ranges()) == in_a
+
+
+class TestRequirementSet(TestCase):
+    def test_requirements_check(self):
+        """ test checking requirements in bulk """
+
+        requirements = RequirementSet([('alpha', '1.2'), ('beta', '[1.0,2.0),[3.0,)'), ('gamma', VersionRange.parse('[1.0,)')), ('delta', '1.0')])
+
+        assert len(requirements) == 4
+        assert 'beta' in requirements
+
+        installed = {'alpha': '1.2.1', 'beta': StandardVersion(3, 1), 'gamma': '1.0', 'delta': '1.0'}
+        assert requirements.check(installed) == []
+
+        installed = {'alpha': '1.1', 'beta': '2.5', 'gamma': 'not-a-version'}
+        assert requirements.check(installed) == [
+            RequirementFailure('alpha', '1.1', '1.2', RequirementSet.UNSATISFIED),
+            RequirementFailure('beta', '2.5', '[1.0,2.0),[3.0,)', RequirementSet.UNSATISFIED),
+            RequirementFailure('gamma', 'not-a-version', '[1.0, )', RequirementSet.INVALID),
+            RequirementFailure('delta', None, '1.0', RequirementSet.MISSING),
+        ]
+
+
+    def test_requirements_memoized(self):
+        """ test repeated checks reuse memoized outcomes """
+
+        requirements = RequirementSet({'alpha': '1.2'})
+
+        assert requirements.check({'alpha': '1.3'}) == []
+        assert requirements.check({'alpha': '1.3'}) == []
+        assert requirements._outcomes.info().hits == 1
+
+
+    def test_requirements_installed(self):
+        """ test checking requirements against the installed distributions """
+
+        assert RequirementSet({'setuptools': '0.1'}).check_installed() == []
+        assert RequirementSet({'livetribe-no-such-package': '0.1'}).check_installed()[0].reason == RequirementSet.MISSING
+
+        with mock.patch('livetribe.utils.version._installed_distributions', return_value=[('outcome', '1.3.0.post0')]):
+            invalidate_distributions()
+            try:
+                failures = RequirementSet({'outcome': '0.1'}).check_installed()
+            finally:
+                invalidate_distributions()
+        assert failures == [RequirementFailure('outcome', '1.3.0.post0', '0.1', RequirementSet.INVALID)]
+
+
+class TestVersionArray(TestCase):
+    def versions(self):
+        return [StandardVersion.parse(v) for v in ('2.0', '1.0-YOKO', '1.0', '1.5', '1.0-RC2', '3.1', '1.0', '1.0-RC10')]
+
+    def check_backend(self, use_numpy):
+        versions = self.versions()
+        column = VersionArray(versions, use_numpy=use_numpy)
+
+        assert len(column) == len(versions)
+        assert list(column) == versions
+        assert column[1] == StandardVersion.parse('1.0-YOKO') and column[1].qualifier == 'YOKO'
+        assert column.to_list() == versions
+
+        ordered = sorted(versions)
+        assert [versions[i] for i in column.argsort()] == ordered
+        assert column.sort().to_list() == ordered
+        assert column.unique().to_list() == sorted(set(versions))
+
+        ordered_column = column.sort()
+        assert ordered_column.searchsorted(StandardVersion.parse('1.0')) == 3
+        assert ordered_column.searchsorted(StandardVersion.parse('1.0'), side='right') == 5
+        assert ordered_column.searchsorted(StandardVersion.parse('1.0-RC5')) == 1
+        assert ordered_column.searchsorted(StandardVersion.parse('9.0')) == len(versions)
+        assert ordered_column.searchsorted(StandardVersion.parse('70000.0')) == len(versions)
+        assert ordered_column.searchsorted(StandardVersion.parse('1.70000')) == 6
+        assert ordered_column.searchsorted(StandardVersion.parse('1.0.70000'), side='right') == 5
+
+        for scalar in ('1.0', '1.0-RC5', '1.0-RC10', '1.5', '0.1', '70000', '1.70000', '1.0.70000', '1.65535.70000', '65535.65535.70000'):
+            scalar = StandardVersion.parse(scalar)
+            assert list(column < scalar) == [v < scalar for v in versions]
+            assert list(column <= scalar) == [v <= scalar for v in versions]
+            assert list(column > scalar) == [v > scalar for v in versions]
+            assert list(column >= scalar) == [v >= scalar for v in versions]
+            assert list(column == scalar) == [v == scalar for v in versions]
+            assert list(column != scalar) == [v != scalar for v in versions]
+
+        for spec in ('[1.0, 2.0)', '(1.0-RC2, 2.0]', '(,1.0)', '[1.5,)', '[1.0-RC10]', '[1.0, 99999.0)', '(70000.0,)', '[1.70000,3.1]',
+                     '(,1.0.70000]', '(1.0.70000,2.0)', '[70000,80000]'):
+            version_range = VersionRange.parse(spec)
+            assert list(column.within(version_range)) == [version_range.contains(v) for v in versions]
+
+        version_set = VersionSet.parse('[1.0-RC2,1.0-RC10],[3.0,)')
+        assert list(column.within(version_set)) == [v in version_set for v in versions]
+        assert list(column.within(VersionSet())) == [False] * len(versions)
+
+        selected = column[column >= StandardVersion.parse('1.5')]
+        assert selected.to_list() == [v for v in versions if v >= StandardVersion.parse('1.5')]
+        assert column[1:3].to_list() == versions[1:3]
+        assert column[[0, 2]].to_list() == [versions[0], versions[2]]
+
+
+    def test_array_backend(self):
+        """ test VersionArray with the array module backend """
+
+        self.check_backend(False)
+
+
+    def test_numpy_backend(self):
+        """ test VersionArray with the NumPy backend """
+
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('NumPy is not installed')
+        self.check_backend(True)
+
+
+    def test_array_overflow(self):
+        """ test VersionArray rejects versions that cannot be packed """
+
+        try:
+            VersionArray(['70000.0'])
+            assert False, 'Should have raised an exception for unpackable version'
+        except OverflowError:
+            pass
+
+
+class TestConcurrency(TestCase):
+    THREADS = 8
+
+    def setUp(self):
+        rng = random.Random(5)
+        self.strings = ['%d.%d.%d%s' % (rng.randrange(5), rng.randrange(5), rng.randrange(5), rng.choice(['', '-rc1', '-beta2'])) for _ in range(2000)]
+        self.specs = ['[1.0,2.0)', '(,1.5]', '[3.0,)', '[1.0,2.0),[3.0,4.0)']
+        versions = [StandardVersion.parse(s) for s in self.strings]
+        self.expected_order = [str(v) for v in sorted(versions)]
+        self.expected_matches = [[VersionSet.parse(spec).contains(v) for v in versions] for spec in self.specs]
+
+    def hammer(self, rounds):
+        versions = [StandardVersion.parse(s) for s in self.strings]
+        for _ in range(rounds):
+            if [str(v) for v in sorted(versions)] != self.expected_order:
+                return False
+            for spec, expected in zip(self.specs, self.expected_matches):
+                matcher = compile_range(spec)
+                ranges = VersionRange.parse_all(spec)
+                if [matcher(v) for v in versions] != expected:
+                    return False
+                if [any(r.contains(v) for r in ranges) for v in versions] != expected:
+                    return False
+        return True
+
+    def run_threads(self, threads, rounds):
+        results = []
+
+        def worker():
+            results.append(self.hammer(rounds))
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.time()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results, time.time() - start
+
+    def test_concurrent_parse_compare_contains(self):
+        """ test parse, compare and contains from many threads """
+
+        StandardVersion.enable_cache(256)
+        VersionRange.enable_cache(16)
+        try:
+            results = self.run_threads(self.THREADS, 3)[0]
+        finally:
+            VersionRange.disable_cache()
+            StandardVersion.disable_cache()
+
+        assert results == [True] * self.THREADS
+
+    def test_concurrent_scaling(self):
+        """ test throughput scales with threads on free-threaded builds """
+
+        if getattr(sys, '_is_gil_enabled', lambda: True)():
+            self.skipTest('throughput only scales on free-threaded builds')
+
+        single = self.run_threads(1, 3)[1]
+        results, parallel = self.run_threads(4, 3)
+
+        assert results == [True] * 4
+        assert parallel < 2.5 * single, '4 threads took %.2fs, 1 thread took %.2fs' % (parallel, single)